@@ -1,14 +1,37 @@
-from .backends import AvailableKeys, MemoryCache, RedisCache, RedisConfig
+from .backends import (
+    AvailableKeys,
+    DiskCache,
+    DiskConfig,
+    KeyHasher,
+    MemoryCache,
+    MemoryConfig,
+    RedisCache,
+    RedisConfig,
+    SharedMemoryCache,
+    SharedMemoryConfig,
+    TieredCache,
+    TieredConfig,
+)
 from .decorators import cache
+from .metrics import CacheMetrics
 from .middleware import cache_middleware
 from .setup import setup_cache
 
 
 __all__ = (
     "AvailableKeys",
+    "CacheMetrics",
+    "DiskCache",
+    "DiskConfig",
+    "KeyHasher",
     "MemoryCache",
+    "MemoryConfig",
     "RedisCache",
     "RedisConfig",
+    "SharedMemoryCache",
+    "SharedMemoryConfig",
+    "TieredCache",
+    "TieredConfig",
     "cache",
     "cache_middleware",
     "setup_cache",
@@ -1,15 +1,75 @@
+import asyncio
+import base64
+import contextlib
 import enum
-import pickle  # nosec
+import fnmatch
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import stat
+import struct
+import tempfile
 import time
+import uuid
 
-from hashlib import sha256
-from typing import Any, Dict, Optional, Tuple, TypeVar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b, sha256
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlencode
 
 import aiohttp.web
 import redis.asyncio as aioredis
 
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from aiohttp_cache.circuit_breaker import CircuitBreaker
+from aiohttp_cache.compression import Compressor, get_compressor
+from aiohttp_cache.exceptions import HTTPCache
+from aiohttp_cache.metrics import CacheMetrics
+from aiohttp_cache.serializers import (
+    BinarySerializer,
+    Serializer,
+    get_serializer,
+)
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover
+    # Python < 3.8
+    resource_tracker = shared_memory = None  # type: ignore
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
 
-T = TypeVar("T", bound=Any)
+log = logging.getLogger("aiohttp")
 
 
 class AvailableKeys(enum.Enum):
@@ -32,18 +92,199 @@ DEFAULT_KEY_PATTERN = (
 )
 
 
+# Components of the key which don't need the body of the request
+_KEY_GETTERS: Dict[AvailableKeys, Callable[[aiohttp.web.Request], str]] = {
+    AvailableKeys.method: lambda request: request.method,
+    AvailableKeys.host: lambda request: request.url.host or "",
+    AvailableKeys.path: lambda request: request.rel_url.path_qs,
+    AvailableKeys.ctype: lambda request: request.content_type,
+}
+
+# Components of the key built from the body of the request
+_BODY_KEYS = (AvailableKeys.postdata, AvailableKeys.json)
+
+
+class KeyHasher:
+    """Hash function used to build the cache keys.
+
+    :param factory: returns a new hash object, like `hashlib.sha256`
+    :param encode: encodes the digest of the hash object as a string
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        encode: Callable[[bytes], str] = bytes.hex,
+    ):
+        self.factory = factory
+        self.encode = encode
+
+
+def _b64encode(digest: bytes) -> str:
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+KEY_HASHERS: Dict[str, KeyHasher] = {
+    # 64 hexadecimal characters
+    "sha256": KeyHasher(sha256),
+    # 128 bits encoded in 22 characters
+    "blake2b": KeyHasher(lambda: blake2b(digest_size=16), _b64encode),
+}
+if xxhash is not None:
+    KEY_HASHERS["xxhash"] = KeyHasher(xxhash.xxh3_128, _b64encode)
+
+
+def get_key_hasher(key_hasher: Union[str, KeyHasher]) -> KeyHasher:
+    """Return the key hasher, looking it up by name if needed."""
+    if isinstance(key_hasher, KeyHasher):
+        return key_hasher
+
+    try:
+        return KEY_HASHERS[key_hasher.lower()]
+    except KeyError:
+        raise HTTPCache(
+            f"Invalid key hasher selected: '{key_hasher}'. "
+            f"Available: {', '.join(KEY_HASHERS)}"
+        ) from None
+
+
+def _match_any(patterns: Sequence[str]) -> Callable[[str], bool]:
+    """Return whether a name matches any of the shell-style patterns."""
+    if not patterns:
+        return lambda name: False
+    regex = re.compile("|".join(fnmatch.translate(p) for p in patterns))
+    return lambda name: regex.match(name) is not None
+
+
+def _header_getter(name: str) -> Callable[[aiohttp.web.Request], str]:
+    return lambda request: request.headers.get(name, "")
+
+
+class KeyBuilder:
+    """Build the cache key of the requests from a key pattern.
+
+    The pattern is compiled once, so only the components it uses are
+    computed for each request, and the body is read only if needed. Keys
+    are hashed incrementally, without joining the components.
+
+    The query of the path could be normalized, so equivalent requests share
+    the same key: `sort_query` sorts its params, `query_allow` only keeps
+    the params matching its patterns (like `"page"` or `"filter_*"`) and
+    `query_deny` drops the params matching its patterns (like `"utm_*"`).
+    The values of the `key_headers` headers are added to the key.
+    """
+
+    def __init__(
+        self,
+        key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
+        encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
+        sort_query: bool = False,
+        query_allow: Optional[Sequence[str]] = None,
+        query_deny: Sequence[str] = (),
+        key_headers: Sequence[str] = (),
+    ):
+        if not all(isinstance(key, AvailableKeys) for key in key_pattern):
+            raise AssertionError()
+
+        self.key_pattern = key_pattern
+        self.encrypt_key = encrypt_key
+        self.key_hasher = get_key_hasher(key_hasher)
+        self.sort_query = sort_query
+        self.query_allow = query_allow
+        self.query_deny = tuple(query_deny)
+        self.key_headers = tuple(key_headers)
+
+        getters = dict(_KEY_GETTERS)
+        if sort_query or query_allow is not None or query_deny:
+            getters[AvailableKeys.path] = self._normalized_path
+
+        #
+        # Getter of each component of the key, None is used for the
+        # components built from the body
+        #
+        self._getters = tuple(getters.get(key) for key in key_pattern) + tuple(
+            _header_getter(name) for name in self.key_headers
+        )
+        self._read_body = any(key in _BODY_KEYS for key in key_pattern)
+
+        self._allowed = (
+            None if query_allow is None else _match_any(query_allow)
+        )
+        self._denied = _match_any(query_deny)
+
+    def _normalized_path(self, request: aiohttp.web.Request) -> str:
+        """Return the path and the allowed query params, maybe sorted."""
+        url = request.rel_url
+        params = [
+            (name, value)
+            for name, value in url.query.items()
+            if (self._allowed is None or self._allowed(name))
+            and not self._denied(name)
+        ]
+        if self.sort_query:
+            params.sort()
+        if not params:
+            return url.path
+        return f"{url.path}?{urlencode(params)}"
+
+    async def __call__(self, request: aiohttp.web.Request) -> str:
+        body = await request.read() if self._read_body else b""
+
+        if self.encrypt_key:
+            digest = self.key_hasher.factory()
+            for i, getter in enumerate(self._getters):
+                if i:
+                    digest.update(b"#")
+                digest.update(
+                    body if getter is None else getter(request).encode()
+                )
+            return self.key_hasher.encode(digest.digest())
+
+        text = body.decode(request.charset or "utf-8") if body else ""
+        return "#".join(
+            text if getter is None else getter(request)
+            for getter in self._getters
+        )
+
+
 class BaseCache:
     def __init__(
         self,
         expiration: int = 300,
         key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
         encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
     ):
-        self.encrypt_key = encrypt_key
         self.expiration = expiration
-        self.key_pattern = key_pattern
+        self._key_builder = KeyBuilder(key_pattern, encrypt_key, key_hasher)
+
+        #
+        # Responses being generated by this process, see single flight in
+        # the cache middleware
+        #
+        self.in_flight: Dict[str, "asyncio.Future[Optional[dict]]"] = {}
+
+        # Timeout of the lock shared with other processes, if supported
+        self.lock_timeout: Optional[float] = None
+
+        # Compression of the cached bodies
+        self.compressor: Optional[Compressor] = None
+        self.compression_min_size = 1024
+
+        #
+        # Responses which could be cached: statuses, None for any, maximum
+        # size of the body, and expiration of the 404 and 410 responses,
+        # None for the expiration of the others
+        #
+        self.cacheable_statuses: Optional[Collection[int]] = None
+        self.max_body_size: Optional[int] = None
+        self.negative_expiration: Optional[int] = None
 
-    async def get(self, key: str) -> Optional[T]:
+        # Metrics of the cache, only recorded if set
+        self.metrics: Optional[CacheMetrics] = None
+
+    async def get(self, key: str) -> Optional[Any]:
         raise NotImplementedError()
 
     async def delete(self, key: str) -> None:
@@ -55,43 +296,167 @@ class BaseCache:
     async def clear(self) -> None:
         raise NotImplementedError()
 
-    async def set(self, key: str, value: dict, expires: int = 3000) -> None:
+    async def set(self, key: str, value: Any, expires: int = 3000) -> None:
         raise NotImplementedError()
 
-    async def make_key(self, request: aiohttp.web.Request) -> str:
-        k = AvailableKeys
-        known_keys = {
-            k.method: request.method,
-            k.path: request.rel_url.path_qs,
-            k.host: request.url.host,
-            k.postdata: "".join(await request.text()),
-            k.ctype: request.content_type,
-            k.json: await request.text(),
-        }
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        """Get the values of the keys, None for the missing ones."""
+        return [await self.get(key) for key in keys]
 
-        if not all(key in k for key in known_keys):
-            raise AssertionError()
-        key = "#".join(known_keys[key] for key in self.key_pattern)
+    async def has_many(self, keys: Sequence[str]) -> List[bool]:
+        """Return whether each of the keys is cached."""
+        return [await self.has(key) for key in keys]
 
-        if self.encrypt_key:
-            key = sha256(key.encode()).hexdigest()
+    async def get_range(
+        self, key: str, start: int, stop: Optional[int]
+    ) -> Optional[Tuple[Any, Optional[int]]]:
+        """Get a cached response with only a range of its body.
+
+        `start` and `stop` select the range like a slice of the body.
+        Returns the response and the size of its whole body. Values which
+        are not a response with a body are returned whole, with None as
+        size, and None if the key is missing.
+        """
+        value = await self.get(key)
+        if value is None:
+            return None
+        if not isinstance(value, dict) or not isinstance(
+            value.get("body"), (bytes, bytearray, memoryview)
+        ):
+            return value, None
+
+        body = memoryview(value["body"])
+        return dict(value, body=body[start:stop]), len(body)
+
+    async def set_many(
+        self, items: Mapping[str, dict], expires: int = 3000
+    ) -> None:
+        """Set the values of the keys, all with the same expiration."""
+        for key, value in items.items():
+            await self.set(key, value, expires)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            await self.delete(key)
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        """Tag the entry, so it is deleted when any of its tags is."""
+        raise NotImplementedError()
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        """Delete every entry with the tag.
+
+        Returns the keys of the deleted entries.
+        """
+        raise NotImplementedError()
+
+    async def acquire_lock(self, key: str) -> bool:
+        """Acquire the lock shared with other processes for the key.
+
+        Returns False if it is already held by another process.
+        """
+        return True
+
+    async def release_lock(self, key: str) -> None:
+        """Release the lock shared with other processes for the key."""
+
+    async def start(self) -> None:
+        """Start the background tasks of the backend, on app startup."""
+
+    async def close(self) -> None:
+        """Stop the background tasks of the backend, on app cleanup."""
+
+    @property
+    def key_pattern(self) -> Tuple[AvailableKeys, ...]:
+        return self._key_builder.key_pattern
+
+    @key_pattern.setter
+    def key_pattern(self, key_pattern: Tuple[AvailableKeys, ...]) -> None:
+        self._key_builder = KeyBuilder(
+            key_pattern, self.encrypt_key, self.key_hasher
+        )
+
+    @property
+    def encrypt_key(self) -> bool:
+        return self._key_builder.encrypt_key
+
+    @encrypt_key.setter
+    def encrypt_key(self, encrypt_key: bool) -> None:
+        self._key_builder = KeyBuilder(
+            self.key_pattern, encrypt_key, self.key_hasher
+        )
 
-        return key
+    @property
+    def key_hasher(self) -> KeyHasher:
+        return self._key_builder.key_hasher
+
+    @key_hasher.setter
+    def key_hasher(self, key_hasher: Union[str, KeyHasher]) -> None:
+        self._key_builder = KeyBuilder(
+            self.key_pattern, self.encrypt_key, key_hasher
+        )
+
+    async def make_key(self, request: aiohttp.web.Request) -> str:
+        return await self._key_builder(request)
 
     def _calculate_expires(self, expires: int) -> int:
         return self.expiration if expires is None or expires < 0 else expires
 
 
+async def _cancel(task: Optional["asyncio.Future[Any]"]) -> None:
+    """Cancel the task and wait for it."""
+    if task is None:
+        return
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
 class _Config:
-    def __init__(self, expiration: int = 300):
+    def __init__(
+        self,
+        expiration: int = 300,
+        compression: Union[str, Compressor, None] = None,
+        compression_min_size: int = 1024,
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expiration: Optional[int] = None,
+    ):
         self.expiration = expiration
+        self.compression = compression
+        self.compression_min_size = compression_min_size
+        self.cacheable_statuses = cacheable_statuses
+        self.max_body_size = max_body_size
+        self.negative_expiration = negative_expiration
 
 
 # --------------------------------------------------------------------------
 # REDIS BACKEND
 # --------------------------------------------------------------------------
 class RedisConfig(_Config):
-    """Redis configuration as a caching backend."""
+    """Redis configuration as a caching backend.
+
+    :param auto_batch: merge the gets issued in the same iteration of the
+        event loop into a single MGET
+    :param unix_socket_path: connect through the unix socket instead of
+        host and port
+    :param max_connections: maximum size of the connection pool
+    :param socket_timeout: seconds to wait for a redis response
+    :param socket_connect_timeout: seconds to wait for a connection
+    :param health_check_interval: seconds between two health checks of
+        the idle connections, 0 disables them
+    :param circuit_breaker: skip the cache while redis is failing
+    :param cacheable_statuses: statuses of the cached responses, `None`
+        caches any status
+    :param max_body_size: maximum size in bytes of the cached bodies
+    :param negative_expiration: expiration in seconds of the 404 and 410
+        responses, `None` uses the expiration of the others
+    """
 
     def __init__(
         self,
@@ -100,14 +465,114 @@ class RedisConfig(_Config):
         db: int = 0,
         password: Optional[str] = None,
         key_prefix: Optional[str] = None,
+        lock_timeout: Optional[float] = None,
+        serializer: Union[str, Serializer] = "binary",
+        compression: Union[str, Compressor, None] = None,
+        compression_min_size: int = 1024,
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expiration: Optional[int] = None,
+        auto_batch: bool = False,
+        unix_socket_path: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        socket_timeout: Optional[float] = None,
+        socket_connect_timeout: Optional[float] = None,
+        health_check_interval: int = 0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.host = host
         self.port = port
         self.password = password
         self.db = db
         self.key_prefix = key_prefix or ""
+        self.lock_timeout = lock_timeout
+        self.serializer = serializer
+        self.auto_batch = auto_batch
+        self.unix_socket_path = unix_socket_path
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout
+        self.health_check_interval = health_check_interval
+        self.circuit_breaker = circuit_breaker
+
+        super(RedisConfig, self).__init__(
+            compression=compression,
+            compression_min_size=compression_min_size,
+            cacheable_statuses=cacheable_statuses,
+            max_body_size=max_body_size,
+            negative_expiration=negative_expiration,
+        )
+
+
+# Read the head and a range of the body of a response serialized by the
+# binary serializer (frame: magic (1) | flags (1) | status (2) | headers
+# size (4) | extra size (4)), or the whole value of other keys
+_GET_RANGE_SCRIPT = """
+local frame = redis.call("GETRANGE", KEYS[1], 0, 11)
+if #frame < 12 or frame:sub(1, 1) ~= "R" or frame:byte(2) % 2 == 1 then
+    return {redis.call("GET", KEYS[1])}
+end
 
-        super(RedisConfig, self).__init__()
+local function u32(s, i)
+    local a, b, c, d = s:byte(i, i + 3)
+    return ((a * 256 + b) * 256 + c) * 256 + d
+end
+local offset = 12 + u32(frame, 5) + u32(frame, 9)
+local size = redis.call("STRLEN", KEYS[1]) - offset
+
+local start = tonumber(ARGV[1])
+local stop = size
+if ARGV[2] ~= "" then
+    stop = tonumber(ARGV[2])
+end
+if start < 0 then
+    start = math.max(size + start, 0)
+end
+if stop < 0 then
+    stop = math.max(size + stop, 0)
+end
+start = math.min(start, size)
+stop = math.min(stop, size)
+
+local body = ""
+if start < stop then
+    body = redis.call("GETRANGE", KEYS[1], offset + start, offset + stop - 1)
+end
+return {redis.call("GETRANGE", KEYS[1], 0, offset - 1), size, body}
+"""
+
+# Delete the lock only if it is still held by this process
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+# Add the key to the set of a tag, which lives as long as its longest entry
+_ADD_TAG_SCRIPT = """
+local expires = tonumber(ARGV[1])
+local ttl = redis.call("TTL", KEYS[1])
+redis.call("SADD", KEYS[1], ARGV[2])
+if expires == 0 then
+    redis.call("PERSIST", KEYS[1])
+elseif ttl == -2 or (ttl >= 0 and ttl < expires) then
+    redis.call("EXPIRE", KEYS[1], expires)
+end
+"""
+
+# Number of keys scanned or unlinked in a single command
+SCAN_BATCH = 1000
+
+# Prefix of the keys of the tags, out of the keyspace of the entries
+TAG_KEY_PREFIX = "aiohttp_cache:tag:"
+
+
+def _escape_glob(pattern: str) -> str:
+    for char in "\\*?[]":
+        pattern = pattern.replace(char, "\\" + char)
+    return pattern
 
 
 class RedisCache(BaseCache):
@@ -120,6 +585,7 @@ class RedisCache(BaseCache):
         expiration: int = 300,
         key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
         encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
     ):
         BaseCache.__init__(self, config.expiration)
 
@@ -128,23 +594,51 @@ class RedisCache(BaseCache):
             port=config.port,
             db=config.db,
             password=config.password,
+            unix_socket_path=config.unix_socket_path,
+            max_connections=config.max_connections,
+            socket_timeout=config.socket_timeout,
+            socket_connect_timeout=config.socket_connect_timeout,
+            health_check_interval=config.health_check_interval,
         )
+        self.circuit_breaker = config.circuit_breaker
         self.key_prefix = config.key_prefix
         super().__init__(
             expiration=expiration,
             key_pattern=key_pattern,
             encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
         )
+        self.lock_timeout = config.lock_timeout
+        self.serializer = get_serializer(config.serializer)
+        self.compressor = get_compressor(config.compression)
+        self.compression_min_size = config.compression_min_size
+        self.cacheable_statuses = config.cacheable_statuses
+        self.max_body_size = config.max_body_size
+        self.negative_expiration = config.negative_expiration
+        self._lock_token = uuid.uuid4().hex
 
-    @staticmethod
-    def dump_object(value: dict) -> bytes:
+        self.auto_batch = config.auto_batch
+        self._pending_gets: Dict[str, List["asyncio.Future[Any]"]] = {}
+        self._batch_tasks: Set["asyncio.Future[None]"] = set()
+
+    async def _call(self, awaitable: Awaitable[Any]) -> Any:
+        """Await the redis call, through the circuit breaker if any."""
+        if self.circuit_breaker is None:
+            return await awaitable
+        return await self.circuit_breaker.call(awaitable)
+
+    async def _execute(self, *args: Any) -> Any:
+        # Untyped in redis-py
+        execute_command: Callable[
+            ..., Awaitable[Any]
+        ] = self._redis_pool.execute_command
+        return await self._call(execute_command(*args))
+
+    def dump_object(self, value: dict) -> bytes:
         """Serialize the object into bytes."""
-        t = type(value)
-        if t in (int,):
-            return str(value).encode("ascii")
-        return b"!" + pickle.dumps(value)
+        return self.serializer.dumps(value)
 
-    def load_object(self, value: Optional[T] = None) -> Optional[T]:
+    def load_object(self, value: Optional[bytes] = None) -> Any:
         """Deserialize the object.
 
         This might be called with None.
@@ -152,63 +646,457 @@ class RedisCache(BaseCache):
 
         if value is None:
             return None
-        if value.startswith(b"!"):
-            try:
-                return pickle.loads(value[1:])  # nosec
-            except pickle.PickleError:
-                return None
-        try:
-            return int(value)  # type: ignore
-        except ValueError:
-            # before 0.8 we did not have serialization.  Still support that.
-            return value
+        return self.serializer.loads(value)
 
-    async def get(self, key: str) -> Optional[T]:
-        redis_value = await self._redis_pool.execute_command(
-            "GET", self.key_prefix + key
-        )
+    async def get(self, key: str) -> Optional[Any]:
+        if self.auto_batch:
+            return self.load_object(await self._batched_get(key))
+
+        redis_value = await self._execute("GET", self.key_prefix + key)
         return self.load_object(redis_value)
 
-    async def set(
-        self, key: str, value: dict, expires: int = 3000
-    ) -> None:  # noqa
+    async def get_range(
+        self, key: str, start: int, stop: Optional[int]
+    ) -> Optional[Tuple[Any, Optional[int]]]:
+        """Get a cached response with only a range of its body.
+
+        With the binary serializer, the body is appended raw to the entry,
+        so only the head of the entry and the range are read, atomically in
+        a script.
+        """
+        if not isinstance(self.serializer, BinarySerializer):
+            return await super().get_range(key, start, stop)
+
+        result = await self._execute(
+            "EVAL",
+            _GET_RANGE_SCRIPT,
+            1,
+            self.key_prefix + key,
+            start,
+            "" if stop is None else stop,
+        )
+        if len(result) == 1:
+            value = self.load_object(result[0])
+            return None if value is None else (value, None)
+
+        head, body_size, body = result
+        value = self.serializer.loads(head)
+        if value is None:
+            return None
+        value["body"] = body
+        return value, body_size
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+
+        redis_values = await self._execute(
+            "MGET", *(self.key_prefix + key for key in keys)
+        )
+        return [self.load_object(value) for value in redis_values]
+
+    async def get_many_with_ttl(
+        self, keys: Sequence[str]
+    ) -> List[Tuple[Optional[Any], Optional[int]]]:
+        """Get the entries with their remaining time to live, in ms.
+
+        The time to live is None for the entries without expiration.
+        """
+        if not keys:
+            return []
+
+        async with self._redis_pool.pipeline(transaction=True) as pipe:
+            for key in keys:
+                pipe.get(self.key_prefix + key)
+                pipe.pttl(self.key_prefix + key)
+            results = await self._call(pipe.execute())
+
+        return [
+            (self.load_object(value), None if ttl == -1 else ttl)
+            for value, ttl in zip(results[::2], results[1::2])
+        ]
+
+    async def _batched_get(self, key: str) -> Optional[bytes]:
+        """Get the key in the MGET of the current loop iteration."""
+        loop = asyncio.get_running_loop()
+        if not self._pending_gets:
+            loop.call_soon(self._flush_gets)
+
+        waiter = loop.create_future()
+        self._pending_gets.setdefault(key, []).append(waiter)
+        return await waiter  # type: ignore
+
+    def _flush_gets(self) -> None:
+        pending, self._pending_gets = self._pending_gets, {}
+
+        task = asyncio.ensure_future(self._mget(pending))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _mget(
+        self, pending: Dict[str, List["asyncio.Future[Any]"]]
+    ) -> None:
+        try:
+            redis_values = await self._execute(
+                "MGET", *(self.key_prefix + key for key in pending)
+            )
+        except Exception as e:
+            for waiters in pending.values():
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            return
+
+        for waiters, redis_value in zip(pending.values(), redis_values):
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(redis_value)
+
+    def _set_command(
+        self, key: str, value: dict, expires: int
+    ) -> Tuple[Any, ...]:
         dump = self.dump_object(value)
 
         _expires = self._calculate_expires(expires)
 
         if _expires == 0:
-            await self._redis_pool.execute_command(
-                "SET", self.key_prefix + key, dump
-            )
-        else:
-            await self._redis_pool.execute_command(
-                "SETEX", self.key_prefix + key, _expires, dump
-            )
+            return ("SET", self.key_prefix + key, dump)
+        return ("SETEX", self.key_prefix + key, _expires, dump)
+
+    async def set(
+        self, key: str, value: Any, expires: int = 3000
+    ) -> None:  # noqa
+        await self._execute(*self._set_command(key, value, expires))
+
+    async def set_many(
+        self, items: Mapping[str, dict], expires: int = 3000
+    ) -> None:
+        async with self._redis_pool.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.execute_command(*self._set_command(key, value, expires))
+            await self._call(pipe.execute())
 
     async def delete(self, key: str) -> None:
-        await self._redis_pool.execute_command("DEL", self.key_prefix + key)
+        await self._execute("DEL", self.key_prefix + key)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        if keys:
+            await self._execute(
+                "DEL", *(self.key_prefix + key for key in keys)
+            )
 
     async def has(self, key: str) -> bool:
-        return await self._redis_pool.execute_command(
-            "EXISTS", self.key_prefix + key
+        return await self._execute("EXISTS", self.key_prefix + key)
+
+    async def has_many(self, keys: Sequence[str]) -> List[bool]:
+        if not keys:
+            return []
+
+        async with self._redis_pool.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.exists(self.key_prefix + key)
+            return [bool(n) for n in await self._call(pipe.execute())]
+
+    async def acquire_lock(self, key: str) -> bool:
+        if self.lock_timeout is None:
+            return True
+
+        return bool(
+            await self._execute(
+                "SET",
+                self.key_prefix + key + ":lock",
+                self._lock_token,
+                "NX",
+                "PX",
+                int(self.lock_timeout * 1000),
+            )
+        )
+
+    async def release_lock(self, key: str) -> None:
+        if self.lock_timeout is None:
+            return
+
+        await self._execute(
+            "EVAL",
+            _RELEASE_LOCK_SCRIPT,
+            1,
+            self.key_prefix + key + ":lock",
+            self._lock_token,
         )
 
+    async def publish(self, channel: str, message: str) -> None:
+        """Publish the message in the channel."""
+        await self._execute("PUBLISH", self.key_prefix + channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        """Yield the messages published in the channel."""
+        async with self._redis_pool.pubsub() as pubsub:
+            await pubsub.subscribe(self.key_prefix + channel)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"].decode()
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        _expires = self._calculate_expires(expires)
+
+        async with self._redis_pool.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.execute_command(
+                    "EVAL",
+                    _ADD_TAG_SCRIPT,
+                    1,
+                    self.key_prefix + TAG_KEY_PREFIX + tag,
+                    _expires,
+                    key,
+                )
+            await self._call(pipe.execute())
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        """Delete every entry with the tag, in batches.
+
+        Only the scanned members are removed from the set of the tag, the
+        entries tagged meanwhile are kept tagged.
+        """
+        tag_key = self.key_prefix + TAG_KEY_PREFIX + tag
+        keys: Dict[str, None] = {}
+        cursor = 0
+        while True:
+            cursor, members = await self._call(
+                self._redis_pool.sscan(tag_key, cursor, count=SCAN_BATCH)
+            )
+            if members:
+                batch = [member.decode() for member in members]
+                async with self._redis_pool.pipeline(
+                    transaction=False
+                ) as pipe:
+                    pipe.unlink(*(self.key_prefix + key for key in batch))
+                    pipe.srem(tag_key, *members)
+                    await self._call(pipe.execute())
+                keys.update(dict.fromkeys(batch))
+            if not cursor:
+                break
+
+        return list(keys)
+
     async def clear(self) -> None:
+        """Delete the entries without blocking the redis server.
+
+        With a key prefix, the keys are scanned and unlinked in batches.
+        """
         if self.key_prefix:
-            keys = await self._redis_pool.execute_command(
-                "KEYS", self.key_prefix + "*"
-            )
-            if keys:
-                await self._redis_pool.execute_command("DEL", *keys)
+            match = _escape_glob(self.key_prefix) + "*"
+            cursor = 0
+            while True:
+                cursor, keys = await self._call(
+                    self._redis_pool.scan(
+                        cursor, match=match, count=SCAN_BATCH
+                    )
+                )
+                if keys:
+                    await self._execute("UNLINK", *keys)
+                if not cursor:
+                    break
         else:
-            await self._redis_pool.flushdb()
+            await self._call(self._redis_pool.flushdb(asynchronous=True))
 
 
 # --------------------------------------------------------------------------
 # MEMORY BACKEND
 # --------------------------------------------------------------------------
+class MemoryConfig(_Config):
+    """Memory configuration as a caching backend.
+
+    :param max_entries: maximum number of entries kept in memory
+    :param max_size: maximum total size in bytes of the cached bodies
+    :param sweep_interval: seconds between two runs of the background
+        task reclaiming expired entries, `None` disables it
+    :param sweep_batch: maximum number of entries reclaimed before
+        yielding back to the event loop
+    :param compression: encoding of the cached bodies, could be "gzip",
+        "br" or "zstd" (if installed) or a `Compressor`
+    :param compression_min_size: minimum size of the compressed bodies
+    :param cacheable_statuses: statuses of the cached responses, `None`
+        caches any status
+    :param max_body_size: maximum size in bytes of the cached bodies
+    :param negative_expiration: expiration in seconds of the 404 and 410
+        responses, `None` uses the expiration of the others
+    :param snapshot_path: file where the unexpired entries are dumped when
+        the application shuts down, and loaded back in background when it
+        starts, `None` disables it
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_size: Optional[int] = None,
+        sweep_interval: Optional[float] = 60,
+        sweep_batch: int = 1000,
+        compression: Union[str, Compressor, None] = None,
+        compression_min_size: int = 1024,
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expiration: Optional[int] = None,
+        snapshot_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.snapshot_path = snapshot_path
+
+        super(MemoryConfig, self).__init__(
+            compression=compression,
+            compression_min_size=compression_min_size,
+            cacheable_statuses=cacheable_statuses,
+            max_body_size=max_body_size,
+            negative_expiration=negative_expiration,
+        )
+
+
+def _prepare_response(value: Any) -> Any:
+    """Return the cached response in the form served the fastest.
+
+    The headers are kept as an immutable `CIMultiDict`, which aiohttp copies
+    without checking every header again, and the body as bytes.
+    """
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if not (
+        isinstance(value, dict)
+        and "status" in value
+        and isinstance(value.get("headers"), Mapping)
+    ):
+        return value
+
+    value = dict(
+        value, headers=CIMultiDictProxy(CIMultiDict(value["headers"]))
+    )
+    if isinstance(value.get("body"), memoryview):
+        value["body"] = bytes(value["body"])
+    return value
+
+
+def _body_size(value: Any) -> int:
+    """Return the size in bytes of the body of a cached response."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        body = value.get("body")
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            return len(body)
+    return 0
+
+
+#
+# Snapshots of the in-memory backend are a header followed by the entries,
+# least recently used first:
+#
+#   header: magic (4) | version (2)
+#   record: key size (2) | expire date (8) | tags size (2) | value size (4)
+#           key | tags, separated by "\n" | value, serialized as binary
+#
+# An expire date of 0 is an entry which never expires.
+#
+_SNAPSHOT_HEADER = struct.Struct(">4sH")
+_SNAPSHOT_RECORD = struct.Struct(">HqHI")
+_SNAPSHOT_MAGIC = b"ACMS"
+_SNAPSHOT_VERSION = 1
+
+SnapshotEntry = Tuple[str, Any, Optional[int], Sequence[str]]
+
+
+def _write_snapshot(path: str, entries: List[SnapshotEntry]) -> None:
+    """Write the entries to the snapshot file, replacing it atomically."""
+    serializer = BinarySerializer()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION))
+            for key, value, expire_date, tags in entries:
+                key_block = key.encode("utf-8")
+                tags_block = "\n".join(tags).encode("utf-8")
+                data = serializer.dumps(value)
+                f.write(
+                    _SNAPSHOT_RECORD.pack(
+                        len(key_block),
+                        expire_date or 0,
+                        len(tags_block),
+                        len(data),
+                    )
+                )
+                f.write(key_block)
+                f.write(tags_block)
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _read_snapshot(path: str) -> List[SnapshotEntry]:
+    """Read the entries of a snapshot file, none if it is missing."""
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return []
+
+    if _SNAPSHOT_HEADER.unpack_from(content) != (
+        _SNAPSHOT_MAGIC,
+        _SNAPSHOT_VERSION,
+    ):
+        raise HTTPCache(f"Invalid cache snapshot: {path}")
+
+    serializer = BinarySerializer()
+    data = memoryview(content)
+    offset = _SNAPSHOT_HEADER.size
+    entries: List[SnapshotEntry] = []
+    while offset < len(data):
+        (
+            key_size,
+            expire_date,
+            tags_size,
+            value_size,
+        ) = _SNAPSHOT_RECORD.unpack_from(data, offset)
+        offset += _SNAPSHOT_RECORD.size
+
+        key = bytes(data[offset : offset + key_size]).decode("utf-8")
+        offset += key_size
+        tags = bytes(data[offset : offset + tags_size]).decode("utf-8")
+        offset += tags_size
+        value = serializer.loads(
+            data[offset : offset + value_size]  # type: ignore
+        )
+        offset += value_size
+
+        if value is not None:
+            entries.append(
+                (
+                    key,
+                    value,
+                    expire_date or None,
+                    tags.split("\n") if tags else [],
+                )
+            )
+    return entries
+
+
 class MemoryCache(BaseCache):
-    """Memory Cache class."""
+    """Memory Cache class.
+
+    Entries are kept in least recently used order, so when the
+    `max_entries` or `max_size` limits of the config are reached the
+    least recently used entries are evicted first. Expired entries are
+    tracked in a heap ordered by expiration date. Each write drops at
+    most `sweep_batch` of them, the sweeper task started with
+    `start_sweeper` drops the rest.
+    """
 
     def __init__(
         self,
@@ -216,36 +1104,88 @@ class MemoryCache(BaseCache):
         expiration: int = 300,
         key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
         encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
+        config: Optional[MemoryConfig] = None,
     ):
         super().__init__(
             expiration=expiration,
             key_pattern=key_pattern,
             encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
         )
 
+        config = config or MemoryConfig()
+        self.max_entries = config.max_entries
+        self.max_size = config.max_size
+        self.sweep_interval = config.sweep_interval
+        self.sweep_batch = config.sweep_batch
+        self.compressor = get_compressor(config.compression)
+        self.compression_min_size = config.compression_min_size
+        self.cacheable_statuses = config.cacheable_statuses
+        self.max_body_size = config.max_body_size
+        self.negative_expiration = config.negative_expiration
+        self.snapshot_path = config.snapshot_path
+
         #
         # Cache format:
         # (cached object, expire date)
         #
-        self._cache: Dict[str, Tuple[dict, int]] = {}
+        # The expire date is None for the entries which never expire.
+        #
+        self._cache: "OrderedDict[str, Tuple[dict, Optional[int]]]" = (
+            OrderedDict()
+        )
+
+        #
+        # Heap of (expire date, key). It might contain outdated items for
+        # keys which were overwritten or deleted, those are skipped when
+        # popped. The entries which never expire aren't in it.
+        #
+        self._expirations: List[Tuple[int, str]] = []
+
+        # Total size of the cached bodies
+        self._size = 0
+
+        self._sweeper_task: Optional["asyncio.Future[None]"] = None
+        self._restore_task: Optional["asyncio.Future[int]"] = None
+
+        # Keys of each tag, and tags of each key
+        self._tags: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Set[str]] = {}
 
-    async def get(self, key: str) -> Optional[T]:
+    async def get(self, key: str) -> Optional[Any]:
         # Update the keys
         self._update_expiration_key(key)
 
         try:
             cached = self._cache[key]
-
-            return cached[0]  # type: ignore
         except KeyError:
             return None
 
+        self._cache.move_to_end(key)
+
+        return cached[0]  # type: ignore
+
     async def set(
-        self, key: str, value: dict, expires: int = 3000
+        self, key: str, value: Any, expires: int = 3000
     ) -> None:  # noqa
         _expires = self._calculate_expires(expires)
+        expire_date = int(time.time()) + _expires if _expires else None
+
+        self._remove(key)
 
-        self._cache[key] = (value, int(time.time()) + _expires)
+        value = _prepare_response(value)
+        size = _body_size(value)
+        if self.max_size is not None and size > self.max_size:
+            # It would evict the whole cache and still not fit
+            return
+
+        self._cache[key] = (value, expire_date)
+        self._size += size
+        if expire_date is not None:
+            heapq.heappush(self._expirations, (expire_date, key))
+
+        self._evict()
 
     async def has(self, key: str) -> bool:
         # Update the keys
@@ -257,28 +1197,1444 @@ class MemoryCache(BaseCache):
         # Update the keys
         self._update_expiration_key(key)
 
+        self._remove(key)
+
+    async def clear(self) -> None:
+        self._cache = OrderedDict()
+        self._expirations = []
+        self._size = 0
+        self._tags = {}
+        self._key_tags = {}
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        if key not in self._cache:
+            return
+
+        self._key_tags.setdefault(key, set()).update(tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        keys = list(self._tags.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        return keys
+
+    def _remove(self, key: str) -> None:
         try:
-            del self._cache[key]
+            value, _ = self._cache.pop(key)
         except KeyError:
-            pass
+            return
 
-    async def clear(self) -> None:
-        self._cache = {}
+        self._size -= _body_size(value)
+        self._untag(key)
+
+    def _untag(self, key: str) -> None:
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
 
     def _update_expiration_key(self, key: str) -> None:
         try:
             expiration = self._cache[key][1]
 
-            if expiration < int(time.time()):
-                del self._cache[key]
+            if expiration is not None and expiration < int(time.time()):
+                self._remove(key)
         except KeyError:
             pass
 
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """Drop expired entries, popping at most `limit` expirations.
+
+        Returns the number of expirations popped.
+        """
+        return self._purge_expired(limit)
+
+    def start_sweeper(self) -> None:
+        """Start the background task reclaiming expired entries."""
+        if self.sweep_interval is None or self._sweeper_task is not None:
+            return
+
+        self._sweeper_task = asyncio.ensure_future(self._sweeper())
+
+    async def stop_sweeper(self) -> None:
+        """Stop the background task reclaiming expired entries."""
+        task, self._sweeper_task = self._sweeper_task, None
+        await _cancel(task)
+
+    async def start(self) -> None:
+        self.start_sweeper()
+        if self.snapshot_path is not None:
+            # Don't delay the startup, the cache warms up in background
+            self._restore_task = asyncio.ensure_future(self._restore())
+
+    async def close(self) -> None:
+        await self.stop_sweeper()
+        task, self._restore_task = self._restore_task, None
+        await _cancel(task)
+
+    async def dump(self, path: Optional[str] = None) -> int:
+        """Write the unexpired entries to a snapshot file.
+
+        Their expiration dates are kept, so they expire when they would
+        have. Returns the number of entries written.
+        """
+        path = path or self.snapshot_path
+        if path is None:
+            raise HTTPCache("No snapshot path configured")
+
+        if self._restore_task is not None and not self._restore_task.done():
+            # Don't lose the entries of the previous snapshot
+            await asyncio.wait([self._restore_task])
+
+        now = int(time.time())
+        entries: List[SnapshotEntry] = [
+            (key, value, expire_date, sorted(self._key_tags.get(key, ())))
+            for key, (value, expire_date) in self._cache.items()
+            if expire_date is None or expire_date >= now
+        ]
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, _write_snapshot, path, entries)
+        return len(entries)
+
+    async def load(self, path: Optional[str] = None) -> int:
+        """Load the unexpired entries of a snapshot file.
+
+        Entries set since the cache started are kept, and are more recently
+        used than the loaded ones. Entries are inserted in batches of
+        `sweep_batch`, yielding back to the event loop in between. Returns
+        the number of entries loaded.
+        """
+        path = path or self.snapshot_path
+        if path is None:
+            raise HTTPCache("No snapshot path configured")
+
+        loop = asyncio.get_event_loop()
+        entries = await loop.run_in_executor(None, _read_snapshot, path)
+
+        now = int(time.time())
+        loaded = 0
+        # Most recently used first, each one is moved to the front
+        for i, (key, value, expire_date, tags) in enumerate(
+            reversed(entries), 1
+        ):
+            expired = expire_date is not None and expire_date < now
+            if not expired and key not in self._cache:
+                loaded += self._insert_oldest(key, value, expire_date, tags)
+            if i % self.sweep_batch == 0:
+                await asyncio.sleep(0)
+
+        self._evict()
+        return loaded
+
+    async def _restore(self) -> int:
+        try:
+            loaded = await self.load()
+        except Exception:
+            log.exception("Error loading the cache snapshot")
+            return 0
+
+        log.debug("Loaded %d entries from the cache snapshot", loaded)
+        return loaded
+
+    def _insert_oldest(
+        self,
+        key: str,
+        value: Any,
+        expire_date: Optional[int],
+        tags: Sequence[str],
+    ) -> bool:
+        """Insert an entry as the least recently used one."""
+        value = _prepare_response(value)
+        size = _body_size(value)
+        if self.max_size is not None and size > self.max_size:
+            return False
+
+        self._cache[key] = (value, expire_date)
+        self._cache.move_to_end(key, last=False)
+        self._size += size
+        if expire_date is not None:
+            heapq.heappush(self._expirations, (expire_date, key))
+        if tags:
+            self._key_tags[key] = set(tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+        return True
+
+    async def _sweeper(self) -> None:
+        """Periodically reclaim expired entries in bounded batches."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)  # type: ignore
+
+            while self.sweep(self.sweep_batch) >= self.sweep_batch:
+                # Don't block the loop when lots of entries expired
+                await asyncio.sleep(0)
+
+    def _purge_expired(
+        self, limit: Optional[int] = None, rebuild: bool = True
+    ) -> int:
+        """Drop expired entries using the expirations heap.
+
+        At most `limit` expirations are popped, and the heap is rebuilt
+        only if `rebuild` is set.
+        """
+        now = int(time.time())
+        expirations = self._expirations
+        popped = 0
+
+        while expirations and expirations[0][0] < now:
+            if limit is not None and popped >= limit:
+                break
+
+            expire_date, key = heapq.heappop(expirations)
+            popped += 1
+
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] == expire_date:
+                self._remove(key)
+
+        #
+        # Overwritten and deleted keys leave outdated items behind, rebuild
+        # the heap when they are the majority.
+        #
+        if rebuild and len(expirations) > 2 * len(self._cache) + 64:
+            self._expirations = [
+                (expire_date, key)
+                for key, (_, expire_date) in self._cache.items()
+                if expire_date is not None
+            ]
+            heapq.heapify(self._expirations)
+
+        return popped
+
+    def _evict(self) -> None:
+        """Enforce the size limits, least recently used entries first."""
+        # Bounded on the write path, the sweeper does the rest
+        self._purge_expired(
+            self.sweep_batch, rebuild=self.sweep_interval is None
+        )
+
+        while (
+            self.max_entries is not None
+            and len(self._cache) > self.max_entries
+        ) or (self.max_size is not None and self._size > self.max_size):
+            key, (value, _) = self._cache.popitem(last=False)
+            self._size -= _body_size(value)
+            self._untag(key)
+            if self.metrics is not None:
+                self.metrics.evicted()
+
+
+# --------------------------------------------------------------------------
+# TIERED BACKEND
+# --------------------------------------------------------------------------
+class TieredConfig(_Config):
+    """Redis backend with an in-memory cache in front of it.
+
+    :param redis: configuration of the redis backend
+    :param memory_expiration: expiration in seconds of the in-memory
+        entries, which could be outdated for as long
+    :param memory_max_entries: maximum number of in-memory entries
+    :param memory_max_size: maximum total size in bytes of the in-memory
+        cached bodies
+    :param invalidation_channel: redis channel used to evict in-memory
+        entries of the other processes when they are set or deleted,
+        `None` disables it
+    """
+
+    def __init__(
+        self,
+        redis: Optional[RedisConfig] = None,
+        memory_expiration: int = 5,
+        memory_max_entries: Optional[int] = 1024,
+        memory_max_size: Optional[int] = None,
+        invalidation_channel: Optional[str] = None,
+    ):
+        self.redis = redis or RedisConfig()
+        self.memory_expiration = memory_expiration
+        self.memory_max_entries = memory_max_entries
+        self.memory_max_size = memory_max_size
+        self.invalidation_channel = invalidation_channel
+
+        super(TieredConfig, self).__init__()
+
+
+class TieredCache(BaseCache):
+    """In-memory cache in front of a redis cache.
+
+    Hot entries are served from memory, without a round trip to redis.
+    """
+
+    def __init__(
+        self,
+        config: TieredConfig,
+        *,
+        expiration: int = 300,
+        key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
+        encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
+    ):
+        super().__init__(
+            expiration=expiration,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        self.memory = MemoryCache(
+            expiration=config.memory_expiration,
+            config=MemoryConfig(
+                max_entries=config.memory_max_entries,
+                max_size=config.memory_max_size,
+            ),
+        )
+        self.redis = RedisCache(config.redis, expiration=expiration)
+        self.memory_expiration = config.memory_expiration
+        self.invalidation_channel = config.invalidation_channel
+
+        self.lock_timeout = self.redis.lock_timeout
+        self.compressor = self.redis.compressor
+        self.compression_min_size = self.redis.compression_min_size
+        self.cacheable_statuses = self.redis.cacheable_statuses
+        self.max_body_size = self.redis.max_body_size
+        self.negative_expiration = self.redis.negative_expiration
+
+        # Identifies the invalidation messages sent by this process
+        self._origin = uuid.uuid4().hex
+        self._listener_task: Optional["asyncio.Future[None]"] = None
+
+    def _memory_expires(self, expires: int) -> int:
+        expires = self._calculate_expires(expires)
+        if expires == 0:
+            return self.memory_expiration
+        return min(expires, self.memory_expiration)
+
+    async def _fill_memory(
+        self, key: str, value: Any, ttl: Optional[int]
+    ) -> None:
+        """Keep an entry read from redis in memory, for its remaining ttl."""
+        if ttl is None:
+            await self.memory.set(key, value, self.memory_expiration)
+        elif ttl >= 1000:
+            # Not for longer than in redis, an expiration of 0 never expires
+            expires = min(ttl // 1000, self.memory_expiration)
+            await self.memory.set(key, value, expires)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.memory.get(key)
+        if value is not None:
+            return value
+
+        [(value, ttl)] = await self.redis.get_many_with_ttl([key])
+        if value is not None:
+            await self._fill_memory(key, value, ttl)
+        return value
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        values = await self.memory.get_many(keys)
+
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if missing:
+            found = dict(
+                zip(missing, await self.redis.get_many_with_ttl(missing))
+            )
+            for i, key in enumerate(keys):
+                value, ttl = found.get(key, (None, None))
+                if value is not None:
+                    values[i] = value
+                    await self._fill_memory(key, value, ttl)
+
+        return values
+
+    async def set_many(
+        self, items: Mapping[str, dict], expires: int = 3000
+    ) -> None:
+        await self.redis.set_many(items, expires)
+        await self.memory.set_many(items, self._memory_expires(expires))
+        for key in items:
+            await self._invalidate(key)
+
+    async def set(
+        self, key: str, value: Any, expires: int = 3000
+    ) -> None:  # noqa
+        await self.redis.set(key, value, expires)
+        await self.memory.set(key, value, self._memory_expires(expires))
+        await self._invalidate(key)
+
+    async def has(self, key: str) -> bool:
+        return await self.memory.has(key) or await self.redis.has(key)
+
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(key)
+        await self.memory.delete(key)
+        await self._invalidate(key)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        await self.redis.delete_many(keys)
+        await self.memory.delete_many(keys)
+        for key in keys:
+            await self._invalidate(key)
+
+    async def clear(self) -> None:
+        await self.redis.clear()
+        await self.memory.clear()
+        await self._invalidate("*")
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        await self.redis.add_tags(key, tags, expires)
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        keys = await self.redis.invalidate_tag(tag)
+        await self.memory.delete_many(keys)
+        for key in keys:
+            await self._invalidate(key)
+        return keys
+
+    async def acquire_lock(self, key: str) -> bool:
+        return await self.redis.acquire_lock(key)
+
+    async def release_lock(self, key: str) -> None:
+        await self.redis.release_lock(key)
+
+    async def start(self) -> None:
+        await self.memory.start()
+        if self.invalidation_channel is not None:
+            self._listener_task = asyncio.ensure_future(self._listen())
+
+    async def close(self) -> None:
+        task, self._listener_task = self._listener_task, None
+        await _cancel(task)
+        await self.memory.close()
+
+    async def _invalidate(self, key: str) -> None:
+        """Evict the key from the in-memory cache of the other processes."""
+        if self.invalidation_channel is not None:
+            await self.redis.publish(
+                self.invalidation_channel, f"{self._origin}:{key}"
+            )
+
+    async def _listen(self) -> None:
+        """Evict the in-memory entries invalidated by other processes."""
+        while True:
+            try:
+                async for message in self.redis.subscribe(
+                    self.invalidation_channel  # type: ignore
+                ):
+                    origin, _, key = message.partition(":")
+                    if origin == self._origin:
+                        continue
+                    if key == "*":
+                        await self.memory.clear()
+                    else:
+                        await self.memory.delete(key)
+            except aioredis.RedisError:
+                log.exception("Error listening to cache invalidations")
+
+                # Entries might have been missed meanwhile
+                await self.memory.clear()
+                await asyncio.sleep(1)
+
+
+# --------------------------------------------------------------------------
+# DISK BACKEND
+# --------------------------------------------------------------------------
+#
+# Entries are appended to segment files ("<n>.seg"), prefixed by the digest
+# of their key. The index file is a log of fixed size records, after a
+# header holding its generation:
+#
+#   header: magic (4) | generation (4)
+#   record: key digest (16) | segment (4) | offset (8) | size (4) |
+#           expire date (8)
+#
+# Records of size 0 delete their key. Writers append under an exclusive
+# lock of the directory. Readers never lock: they read the records appended
+# since their last read, and start over when the generation changes, after
+# a clear or a compaction of the index. The index is compacted when it
+# holds more than twice the live records.
+#
+# Tags are appended to the tags file, a log of the keys of each tag after a
+# header holding the generation of the index it belongs to:
+#
+#   header: magic (4) | generation (4)
+#   record: tag digest (16) | expire date (8) | key size (2) | key
+#
+# Records without key delete their tag. The tags file is only read and
+# written under the lock, it is rewritten with the index.
+#
+_DISK_HEADER = struct.Struct(">4sI")
+_DISK_RECORD = struct.Struct(">16sIQId")
+_DISK_MAGIC = b"ACDI"
+_DISK_TAG_RECORD = struct.Struct(">16sdH")
+_DISK_TAGS_MAGIC = b"ACDT"
+_DIGEST_SIZE = 16
+# Minimum number of outdated records of the index before it is compacted
+_DISK_COMPACT_MIN = 1024
+
+
+class DiskConfig(_Config):
+    """Disk configuration as a caching backend.
+
+    :param path: directory of the cache files, shared by the processes
+        using the same directory. It is created readable by its owner only
+    :param max_size: maximum total size in bytes of the segment files, the
+        oldest segments are dropped first
+    :param segment_size: size in bytes of the segment files
+    :param serializer: how to serialize the entries, could be "binary",
+        "msgpack" (if installed), "pickle" or a `Serializer`
+    :param compression: encoding of the cached bodies, could be "gzip",
+        "br" or "zstd" (if installed) or a `Compressor`
+    :param compression_min_size: minimum size of the compressed bodies
+    :param cacheable_statuses: statuses of the cached responses, `None`
+        caches any status
+    :param max_body_size: maximum size in bytes of the cached bodies
+    :param negative_expiration: expiration in seconds of the 404 and 410
+        responses, `None` uses the expiration of the others
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 1024 * 1024 * 1024,
+        segment_size: int = 64 * 1024 * 1024,
+        serializer: Union[str, Serializer] = "binary",
+        compression: Union[str, Compressor, None] = None,
+        compression_min_size: int = 1024,
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expiration: Optional[int] = None,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.serializer = serializer
+
+        super(DiskConfig, self).__init__(
+            compression=compression,
+            compression_min_size=compression_min_size,
+            cacheable_statuses=cacheable_statuses,
+            max_body_size=max_body_size,
+            negative_expiration=negative_expiration,
+        )
+
+
+class DiskCache(BaseCache):
+    """Disk Cache class, shared by the processes of a host.
+
+    Entries are stored in append-only segment files, read through `mmap`:
+    with the binary serializer the cached bodies are memoryviews of the
+    mapped files, never copied. The cache survives restarts.
+
+    The files are read and written in a thread of the cache, which owns the
+    index, so the event loop never waits for the disk or the lock.
+    """
+
+    def __init__(
+        self,
+        *,
+        expiration: int = 300,
+        key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
+        encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
+        config: DiskConfig,
+    ):
+        if fcntl is None:  # pragma: no cover
+            raise HTTPCache("Disk cache requires fcntl, not available")
+
+        super().__init__(
+            expiration=expiration,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        self.path = config.path
+        self.max_size = config.max_size
+        self.segment_size = config.segment_size
+        self.serializer = get_serializer(config.serializer)
+        self.compressor = get_compressor(config.compression)
+        self.compression_min_size = config.compression_min_size
+        self.cacheable_statuses = config.cacheable_statuses
+        self.max_body_size = config.max_body_size
+        self.negative_expiration = config.negative_expiration
+        self._zero_copy = isinstance(self.serializer, BinarySerializer)
+
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        self._lock_fd = os.open(
+            os.path.join(self.path, "lock"), os.O_RDWR | os.O_CREAT, 0o600
+        )
+        self._index_fd = os.open(
+            os.path.join(self.path, "index"), os.O_RDWR | os.O_CREAT, 0o600
+        )
+        self._tags_fd = os.open(
+            os.path.join(self.path, "tags"), os.O_RDWR | os.O_CREAT, 0o600
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="aiohttp-cache-disk"
+        )
+
+        #
+        # Index format:
+        # {key digest: (segment, offset, size, expire date)}
+        #
+        self._index: Dict[bytes, Tuple[int, int, int, float]] = {}
+        self._index_offset = _DISK_HEADER.size
+        self._generation = -1
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._segment = 0
+        self._segment_fd: Optional[int] = None
+
+        #
+        # Tags format:
+        # {tag digest: {key: expire date}}
+        #
+        self._tags: Dict[bytes, Dict[str, float]] = {}
+        self._tags_offset = _DISK_HEADER.size
+        self._tags_generation = -1
+
+        with self._locked():
+            if os.fstat(self._index_fd).st_size < _DISK_HEADER.size:
+                self._write_header(0)
+            self._sync()
+            self._sync_tags()
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, expires: int = 3000) -> None:
+        await self._run(self._set_many, {key: value}, expires)
+
+    async def set_many(
+        self, items: Mapping[str, dict], expires: int = 3000
+    ) -> None:
+        await self._run(self._set_many, items, expires)
+
+    async def has(self, key: str) -> bool:
+        return await self._run(self._has, key)
+
+    async def delete(self, key: str) -> None:
+        await self.delete_many([key])
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        await self._run(self._delete_many, keys)
+
+    async def clear(self) -> None:
+        await self._run(self._clear)
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        await self._run(self._add_tags, key, tags, expires)
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        return await self._run(self._invalidate_tag, tag)
+
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run the function in the thread of the cache."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _get(self, key: str) -> Optional[Any]:
+        self._sync()
+        data = self._read(self._digest(key))
+        if data is None:
+            return None
+        return self.serializer.loads(
+            data if self._zero_copy else bytes(data)  # type: ignore
+        )
+
+    def _set_many(self, items: Mapping[str, Any], expires: int) -> None:
+        values = [
+            (self._digest(key), self.serializer.dumps(value))
+            for key, value in items.items()
+        ]
+        with self._locked():
+            self._sync()
+            for digest, data in values:
+                self._append(digest, data, expires)
+
+    def _has(self, key: str) -> bool:
+        self._sync()
+        entry = self._index.get(self._digest(key))
+        return entry is not None and not self._is_expired(entry)
+
+    def _delete_many(self, keys: Sequence[str]) -> None:
+        with self._locked():
+            self._sync()
+            for key in keys:
+                self._remove(self._digest(key))
+
+    def _clear(self) -> None:
+        with self._locked():
+            self._sync()
+            for segment in self._segments():
+                os.unlink(self._segment_path(segment))
+            self._write_header(self._generation + 1)
+            self._sync()
+            self._write_tags_header()
+
+    def _add_tags(self, key: str, tags: Sequence[str], expires: int) -> None:
+        _expires = self._calculate_expires(expires)
+        expires_at = time.time() + _expires if _expires else 0.0
+        key_block = key.encode("utf-8")
+        with self._locked():
+            self._sync()
+            self._sync_tags()
+            self._write_tag_records(
+                [
+                    (self._digest(TAG_KEY_PREFIX + tag), expires_at, key_block)
+                    for tag in tags
+                ]
+            )
+
+    def _invalidate_tag(self, tag: str) -> List[str]:
+        with self._locked():
+            self._sync()
+            self._sync_tags()
+            tag_digest = self._digest(TAG_KEY_PREFIX + tag)
+            now = time.time()
+            keys = [
+                key
+                for key, expires_at in self._tags.get(tag_digest, {}).items()
+                if expires_at == 0 or expires_at >= now
+            ]
+            for key in keys:
+                self._remove(self._digest(key))
+            if tag_digest in self._tags:
+                self._write_tag_records([(tag_digest, 0.0, b"")])
+        return keys
+
+    def _close(self) -> None:
+        if self._segment_fd is not None:
+            os.close(self._segment_fd)
+            self._segment_fd = None
+        os.close(self._index_fd)
+        os.close(self._tags_fd)
+        os.close(self._lock_fd)
+        # The mapped files are unmapped once the responses using them are
+        # gone
+        self._maps.clear()
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return blake2b(key.encode("utf-8"), digest_size=_DIGEST_SIZE).digest()
+
+    @staticmethod
+    def _is_expired(entry: Tuple[int, int, int, float]) -> bool:
+        expires_at = entry[3]
+        return expires_at != 0 and expires_at < time.time()
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:08d}.seg")
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[:-4])
+            for name in os.listdir(self.path)
+            if name.endswith(".seg") and name[:-4].isdigit()
+        )
+
+    def _sync(self) -> None:
+        """Read the records appended to the index since the last read."""
+        header = os.pread(self._index_fd, _DISK_HEADER.size, 0)
+        if len(header) < _DISK_HEADER.size:
+            return
+        _, generation = _DISK_HEADER.unpack(header)
+        if generation != self._generation:
+            self._generation = generation
+            self._index.clear()
+            self._maps.clear()
+            self._index_offset = _DISK_HEADER.size
+
+        size = os.fstat(self._index_fd).st_size
+        end = size - (size - _DISK_HEADER.size) % _DISK_RECORD.size
+        if end <= self._index_offset:
+            return
+
+        data = os.pread(
+            self._index_fd, end - self._index_offset, self._index_offset
+        )
+        for (
+            digest,
+            segment,
+            offset,
+            size,
+            expires_at,
+        ) in _DISK_RECORD.iter_unpack(data):
+            if size:
+                self._index[digest] = (segment, offset, size, expires_at)
+            else:
+                self._index.pop(digest, None)
+        self._index_offset = end
+
+    def _sync_tags(self) -> None:
+        """Read the tag records appended since the last read, holding the lock.
+
+        The index must be synced first. A tags file of another generation
+        than the index is outdated, it is started over.
+        """
+        header = os.pread(self._tags_fd, _DISK_HEADER.size, 0)
+        if (
+            len(header) < _DISK_HEADER.size
+            or _DISK_HEADER.unpack(header)[1] != self._generation
+        ):
+            self._write_tags_header()
+            return
+        if self._tags_generation != self._generation:
+            self._tags_generation = self._generation
+            self._tags = {}
+            self._tags_offset = _DISK_HEADER.size
+
+        data = os.pread(
+            self._tags_fd,
+            os.fstat(self._tags_fd).st_size - self._tags_offset,
+            self._tags_offset,
+        )
+        position = 0
+        while position + _DISK_TAG_RECORD.size <= len(data):
+            digest, expires_at, key_size = _DISK_TAG_RECORD.unpack_from(
+                data, position
+            )
+            end = position + _DISK_TAG_RECORD.size + key_size
+            if end > len(data):
+                break
+            if key_size:
+                key = data[end - key_size : end].decode("utf-8")
+                self._tags.setdefault(digest, {})[key] = expires_at
+            else:
+                self._tags.pop(digest, None)
+            position = end
+        self._tags_offset += position
+        if position < len(data):
+            # Torn by a crashed writer
+            os.ftruncate(self._tags_fd, self._tags_offset)
+
+    def _write_tags_header(self) -> None:
+        """Start the tags of the index generation over, holding the lock."""
+        os.pwrite(
+            self._tags_fd,
+            _DISK_HEADER.pack(_DISK_TAGS_MAGIC, self._generation),
+            0,
+        )
+        os.ftruncate(self._tags_fd, _DISK_HEADER.size)
+        self._tags = {}
+        self._tags_offset = _DISK_HEADER.size
+        self._tags_generation = self._generation
+
+    def _write_tag_records(
+        self, records: Sequence[Tuple[bytes, float, bytes]]
+    ) -> None:
+        """Append records to the tags file, holding the lock."""
+        data = b"".join(
+            _DISK_TAG_RECORD.pack(digest, expires_at, len(key_block))
+            + key_block
+            for digest, expires_at, key_block in records
+        )
+        os.pwrite(self._tags_fd, data, self._tags_offset)
+        self._tags_offset += len(data)
+        for digest, expires_at, key_block in records:
+            if key_block:
+                key = key_block.decode("utf-8")
+                self._tags.setdefault(digest, {})[key] = expires_at
+            else:
+                self._tags.pop(digest, None)
+
+    def _read(self, digest: bytes) -> Optional[memoryview]:
+        """Return the data of the entry, without copying it."""
+        entry = self._index.get(digest)
+        if entry is None or self._is_expired(entry):
+            return None
+
+        segment, offset, size, _ = entry
+        end = offset + size
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            try:
+                with open(self._segment_path(segment), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                # Dropped segment, or an empty one
+                return None
+            self._maps[segment] = mapped
+            if len(mapped) < end:
+                return None
+
+        data = memoryview(mapped)[offset:end]
+        # The key digest prefix protects from torn or outdated records
+        if data[:_DIGEST_SIZE] != digest:
+            return None
+        return data[_DIGEST_SIZE:]
+
+    def _append(self, digest: bytes, data: bytes, expires: int) -> None:
+        """Append the entry to the current segment, holding the lock."""
+        _expires = self._calculate_expires(expires)
+        expires_at = time.time() + _expires if _expires else 0.0
+
+        segment_fd = self._writable_segment()
+        offset = os.fstat(segment_fd).st_size
+        os.pwrite(segment_fd, digest + data, offset)
+
+        self._write_record(
+            digest, self._segment, offset, _DIGEST_SIZE + len(data), expires_at
+        )
+
+    def _remove(self, digest: bytes) -> None:
+        """Delete the entry, holding the lock."""
+        if digest in self._index:
+            self._write_record(digest, 0, 0, 0, 0.0)
+
+    def _write_record(
+        self,
+        digest: bytes,
+        segment: int,
+        offset: int,
+        size: int,
+        expires_at: float,
+    ) -> None:
+        os.pwrite(
+            self._index_fd,
+            _DISK_RECORD.pack(digest, segment, offset, size, expires_at),
+            self._index_offset,
+        )
+        self._index_offset += _DISK_RECORD.size
+        if size:
+            self._index[digest] = (segment, offset, size, expires_at)
+        else:
+            self._index.pop(digest, None)
+
+        records = (self._index_offset - _DISK_HEADER.size) // _DISK_RECORD.size
+        if records > 2 * len(self._index) + _DISK_COMPACT_MIN:
+            self._compact(set())
+
+    def _write_header(self, generation: int) -> None:
+        """Start a new generation of the index, holding the lock."""
+        os.pwrite(
+            self._index_fd,
+            _DISK_HEADER.pack(_DISK_MAGIC, generation),
+            0,
+        )
+        os.ftruncate(self._index_fd, _DISK_HEADER.size)
+
+    def _writable_segment(self) -> int:
+        """Return the segment to append to, holding the lock.
+
+        Segments are rotated when they are full, and the oldest ones are
+        dropped when the cache is too big.
+        """
+        fd = self._segment_fd
+        if fd is not None:
+            segment_stat = os.fstat(fd)
+            if (
+                segment_stat.st_nlink
+                and segment_stat.st_size < self.segment_size
+            ):
+                return fd
+            os.close(fd)
+            self._segment_fd = None
+
+        segments = self._segments()
+        last = segments[-1] if segments else 0
+        if (
+            not segments
+            or os.path.getsize(self._segment_path(last)) >= self.segment_size
+        ):
+            last += 1
+            self._drop_segments(segments)
+
+        self._segment = last
+        self._segment_fd = os.open(
+            self._segment_path(last), os.O_RDWR | os.O_CREAT, 0o600
+        )
+        return self._segment_fd
+
+    def _drop_segments(self, segments: List[int]) -> None:
+        """Drop the oldest segments to make room for a new one."""
+        sizes = {
+            segment: os.path.getsize(self._segment_path(segment))
+            for segment in segments
+        }
+        total = sum(sizes.values()) + self.segment_size
+        dropped = set()
+        for segment in segments:
+            if total <= self.max_size:
+                break
+            os.unlink(self._segment_path(segment))
+            total -= sizes[segment]
+            dropped.add(segment)
+
+        if dropped:
+            self._compact(dropped)
+
+    def _compact(self, dropped: Set[int]) -> None:
+        """Rewrite the index with the live entries only, holding the lock.
+
+        The entries of the dropped segments are evicted, and the tags file
+        is rewritten with the live keys of each tag.
+        """
+        self._sync_tags()
+        live = []
+        evicted = 0
+        for digest, entry in self._index.items():
+            if self._is_expired(entry):
+                continue
+            if entry[0] in dropped:
+                evicted += 1
+            else:
+                live.append((digest, entry))
+        if self.metrics is not None:
+            self.metrics.evicted(evicted)
+
+        self._write_header(self._generation + 1)
+        os.pwrite(
+            self._index_fd,
+            b"".join(
+                _DISK_RECORD.pack(digest, *entry) for digest, entry in live
+            ),
+            _DISK_HEADER.size,
+        )
+        self._sync()
+
+        tags = self._tags
+        self._write_tags_header()
+        self._write_tag_records(
+            [
+                (tag_digest, expires_at, key.encode("utf-8"))
+                for tag_digest, keys in tags.items()
+                for key, expires_at in keys.items()
+                if self._digest(key) in self._index
+            ]
+        )
+
+
+# --------------------------------------------------------------------------
+# SHARED MEMORY BACKEND
+# --------------------------------------------------------------------------
+#
+# The shared memory segment holds a header and an arena of fixed size
+# slots, grouped in buckets of `_WAYS` slots indexed by the digest of the
+# keys:
+#
+#   header (64): magic (4) | slots (4) | slot size (4)
+#   slot: sequence (4) | key digest (16) | expire date (8) | store date (8)
+#         | size (4) | data
+#
+# Readers don't lock: the sequence of a slot is odd while it is written,
+# and readers retry if it changed while they copied the slot. Writers lock
+# the byte of their bucket in a lock file, in a directory private to the
+# user, so only writers of the same bucket wait for each other.
+#
+_SHM_HEADER = struct.Struct(">4sII")
+_SHM_HEADER_SIZE = 64
+_SHM_MAGIC = b"ACSM"
+_SHM_SLOT = struct.Struct("=I16sddI")
+_SHM_SEQUENCE = struct.Struct("=I")
+_WAYS = 4
+_READ_RETRIES = 8
+
+
+def _lock_directory() -> str:
+    """Return the directory of the lock files, private to the user."""
+    path = os.path.join(tempfile.gettempdir(), f"aiohttp-cache-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    path_stat = os.lstat(path)
+    if (
+        not stat.S_ISDIR(path_stat.st_mode)
+        or path_stat.st_uid != os.getuid()
+        or path_stat.st_mode & 0o077
+    ):
+        raise HTTPCache(f"Lock directory '{path}' is not private")
+    return path
+
+
+def _tracked_name(shm: "shared_memory.SharedMemory") -> str:
+    """Return the name of the segment in the resource tracker."""
+    # The public name drops the leading slash of POSIX segments
+    return "/" + shm.name
+
+
+class SharedMemoryConfig(_Config):
+    """Shared memory configuration as a caching backend.
+
+    :param name: name of the shared memory segment, shared by the processes
+        using the same name
+    :param slots: number of entries of the cache
+    :param slot_size: size in bytes of the slots, bigger entries are not
+        cached
+    :param serializer: how to serialize the entries, could be "binary",
+        "msgpack" (if installed), "pickle" or a `Serializer`
+    :param compression: encoding of the cached bodies, could be "gzip",
+        "br" or "zstd" (if installed) or a `Compressor`
+    :param compression_min_size: minimum size of the compressed bodies
+    :param cacheable_statuses: statuses of the cached responses, `None`
+        caches any status
+    :param max_body_size: maximum size in bytes of the cached bodies
+    :param negative_expiration: expiration in seconds of the 404 and 410
+        responses, `None` uses the expiration of the others
+    """
+
+    def __init__(
+        self,
+        name: str = "aiohttp-cache",
+        slots: int = 2048,
+        slot_size: int = 16 * 1024,
+        serializer: Union[str, Serializer] = "binary",
+        compression: Union[str, Compressor, None] = None,
+        compression_min_size: int = 1024,
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expiration: Optional[int] = None,
+    ):
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self.serializer = serializer
+
+        super(SharedMemoryConfig, self).__init__(
+            compression=compression,
+            compression_min_size=compression_min_size,
+            cacheable_statuses=cacheable_statuses,
+            max_body_size=max_body_size,
+            negative_expiration=negative_expiration,
+        )
+
+
+class SharedMemoryCache(BaseCache):
+    """Shared Memory Cache class, shared by the processes of a host.
+
+    Entries are kept in a fixed size arena of shared memory, so all the
+    workers of a host share one cache. When the bucket of a key is full,
+    the entry stored first is replaced. The segment outlives the processes
+    until `unlink` is called.
+    """
+
+    def __init__(
+        self,
+        *,
+        expiration: int = 300,
+        key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
+        encrypt_key: bool = True,
+        key_hasher: Union[str, KeyHasher] = "sha256",
+        config: Optional[SharedMemoryConfig] = None,
+    ):
+        if fcntl is None:  # pragma: no cover
+            raise HTTPCache(
+                "Shared memory cache requires fcntl, not available"
+            )
+        if shared_memory is None:  # pragma: no cover
+            raise HTTPCache("Shared memory cache requires Python 3.8+")
+
+        super().__init__(
+            expiration=expiration,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        config = config or SharedMemoryConfig()
+        self.name = config.name
+        self.slots = config.slots - config.slots % _WAYS
+        self.slot_size = config.slot_size
+        self.serializer = get_serializer(config.serializer)
+        self.compressor = get_compressor(config.compression)
+        self.compression_min_size = config.compression_min_size
+        self.cacheable_statuses = config.cacheable_statuses
+        self.max_body_size = config.max_body_size
+        self.negative_expiration = config.negative_expiration
+
+        self._buckets = self.slots // _WAYS
+        self._max_data_size = self.slot_size - _SHM_SLOT.size
+        if self._buckets == 0 or self._max_data_size <= 0:
+            raise HTTPCache("Shared memory cache slots are too small")
+
+        self._shm = self._open(_SHM_HEADER_SIZE + self.slots * self.slot_size)
+        if self._shm.buf is None:  # pragma: no cover
+            raise HTTPCache(f"Shared memory segment '{self.name}' is closed")
+        self._buf: memoryview = self._shm.buf
+        self._lock_fd = os.open(
+            os.path.join(_lock_directory(), f"{self.name}.lock"),
+            os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW,
+            0o600,
+        )
+
+        header = _SHM_HEADER.unpack_from(self._buf)
+        if header[0] != _SHM_MAGIC:
+            # A new segment, full of zeroes, is an empty cache
+            _SHM_HEADER.pack_into(
+                self._buf, 0, _SHM_MAGIC, self.slots, self.slot_size
+            )
+        elif header[1:] != (self.slots, self.slot_size):
+            raise HTTPCache(
+                f"Shared memory segment '{self.name}' has {header[1]} slots "
+                f"of {header[2]} bytes"
+            )
+
+    def _open(self, size: int) -> "shared_memory.SharedMemory":
+        try:
+            shm = shared_memory.SharedMemory(
+                name=self.name, create=True, size=size
+            )
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=self.name)
+            if shm.size < size:
+                shm.close()
+                raise HTTPCache(
+                    f"Shared memory segment '{self.name}' is too small"
+                ) from None
+
+        # The segment outlives the process, for the other workers
+        resource_tracker.unregister(_tracked_name(shm), "shared_memory")
+        return shm
+
+    async def get(self, key: str) -> Optional[Any]:
+        digest = self._digest(key)
+        for slot in self._bucket_slots(digest):
+            data = self._read(slot, digest)
+            if data is not None:
+                return self.serializer.loads(data)
+        return None
+
+    async def set(self, key: str, value: Any, expires: int = 3000) -> None:
+        await self._store(
+            self._digest(key), self.serializer.dumps(value), expires
+        )
+
+    async def has(self, key: str) -> bool:
+        digest = self._digest(key)
+        now = time.time()
+        for slot in self._bucket_slots(digest):
+            _, slot_digest, expires_at, _, _ = _SHM_SLOT.unpack_from(
+                self._buf, self._slot_offset(slot)
+            )
+            if slot_digest == digest:
+                return expires_at == 0 or expires_at >= now
+        return False
+
+    async def delete(self, key: str) -> None:
+        digest = self._digest(key)
+        async with self._locked(digest):
+            self._remove(digest)
+
+    async def clear(self) -> None:
+        async with self._locked():
+            for slot in range(self.slots):
+                self._write(slot, bytes(_DIGEST_SIZE), 0.0, b"")
+
+    async def add_tags(
+        self, key: str, tags: Sequence[str], expires: int = 3000
+    ) -> None:
+        for tag in tags:
+            tag_digest = self._digest(TAG_KEY_PREFIX + tag)
+            async with self._locked(tag_digest):
+                keys = self._read_tag(tag_digest)
+                if key not in keys:
+                    keys.append(key)
+                data = json.dumps(keys).encode("utf-8")
+                if not self._store_locked(tag_digest, data, expires):
+                    log.warning("Too many entries tagged with %s", tag)
+
+    async def invalidate_tag(self, tag: str) -> List[str]:
+        tag_digest = self._digest(TAG_KEY_PREFIX + tag)
+        async with self._locked(tag_digest):
+            keys = self._read_tag(tag_digest)
+            self._remove(tag_digest)
+
+        for key in keys:
+            await self.delete(key)
+        return keys
+
+    async def close(self) -> None:
+        os.close(self._lock_fd)
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared memory segment, once no process uses it."""
+        # Balance the unregistration of `_open`
+        resource_tracker.register(_tracked_name(self._shm), "shared_memory")
+        self._shm.unlink()
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        digest = blake2b(key.encode("utf-8"), digest_size=_DIGEST_SIZE)
+        return digest.digest()
+
+    def _bucket_slots(self, digest: bytes) -> range:
+        bucket = int.from_bytes(digest[:8], "big") % self._buckets
+        return range(bucket * _WAYS, (bucket + 1) * _WAYS)
+
+    def _slot_offset(self, slot: int) -> int:
+        return _SHM_HEADER_SIZE + slot * self.slot_size
+
+    @contextlib.asynccontextmanager
+    async def _locked(
+        self, digest: Optional[bytes] = None
+    ) -> AsyncIterator[None]:
+        """Lock the bucket of the digest against the other writers.
+
+        Without a digest the whole cache is locked. The lock isn't waited
+        for on the event loop, it is retried while another process holds it.
+        """
+        if digest is None:
+            length, start = 0, 0
+        else:
+            length = 1
+            start = int.from_bytes(digest[:8], "big") % self._buckets
+
+        while True:
+            try:
+                fcntl.lockf(
+                    self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, length, start
+                )
+                break
+            except (BlockingIOError, PermissionError):
+                await asyncio.sleep(0)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, length, start)
+
+    def _read(self, slot: int, digest: bytes) -> Optional[bytes]:
+        """Copy the data of the slot, if it holds the digest."""
+        offset = self._slot_offset(slot)
+        for _ in range(_READ_RETRIES):
+            (
+                sequence,
+                slot_digest,
+                expires_at,
+                _,
+                size,
+            ) = _SHM_SLOT.unpack_from(self._buf, offset)
+            if sequence & 1:
+                continue
+            if slot_digest != digest:
+                return None
+
+            start = offset + _SHM_SLOT.size
+            data = bytes(self._buf[start : start + size])
+            if _SHM_SEQUENCE.unpack_from(self._buf, offset)[0] != sequence:
+                continue
+
+            if expires_at and expires_at < time.time():
+                return None
+            return data
+        return None
+
+    def _read_tag(self, tag_digest: bytes) -> List[str]:
+        for slot in self._bucket_slots(tag_digest):
+            data = self._read(slot, tag_digest)
+            if data is not None:
+                return json.loads(data)  # type: ignore
+        return []
+
+    async def _store(self, digest: bytes, data: bytes, expires: int) -> None:
+        if len(data) > self._max_data_size:
+            return
+        async with self._locked(digest):
+            self._store_locked(digest, data, expires)
+
+    def _store_locked(self, digest: bytes, data: bytes, expires: int) -> bool:
+        """Store the data in a slot of its bucket, holding the lock.
+
+        The slot of the same key is reused, otherwise an empty or expired
+        one, otherwise the slot stored first. Returns False if the data is
+        too big.
+        """
+        if len(data) > self._max_data_size:
+            return False
+
+        _expires = self._calculate_expires(expires)
+        now = time.time()
+        expires_at = now + _expires if _expires else 0.0
+
+        chosen = None
+        oldest = None
+        for slot in self._bucket_slots(digest):
+            (
+                _,
+                slot_digest,
+                slot_expires_at,
+                stored_at,
+                size,
+            ) = _SHM_SLOT.unpack_from(self._buf, self._slot_offset(slot))
+            if slot_digest == digest:
+                chosen = slot
+                break
+            if chosen is None and (
+                not size or (slot_expires_at and slot_expires_at < now)
+            ):
+                chosen = slot
+            if oldest is None or stored_at < oldest[0]:
+                oldest = (stored_at, slot)
+
+        if chosen is None:
+            if oldest is None:  # pragma: no cover
+                raise HTTPCache("Shared memory cache bucket without slots")
+            chosen = oldest[1]
+            if self.metrics is not None:
+                self.metrics.evicted()
+        self._write(chosen, digest, expires_at, data)
+        return True
+
+    def _remove(self, digest: bytes) -> None:
+        """Empty the slot of the digest, holding the lock."""
+        for slot in self._bucket_slots(digest):
+            offset = self._slot_offset(slot)
+            if _SHM_SLOT.unpack_from(self._buf, offset)[1] == digest:
+                self._write(slot, bytes(_DIGEST_SIZE), 0.0, b"")
+
+    def _write(
+        self, slot: int, digest: bytes, expires_at: float, data: bytes
+    ) -> None:
+        offset = self._slot_offset(slot)
+        sequence = _SHM_SEQUENCE.unpack_from(self._buf, offset)[0]
+
+        # Odd while the slot is written
+        _SHM_SEQUENCE.pack_into(self._buf, offset, (sequence + 1) & 0xFFFFFFFF)
+        start = offset + _SHM_SLOT.size
+        self._buf[start : start + len(data)] = data
+        _SHM_SLOT.pack_into(
+            self._buf,
+            offset,
+            (sequence + 1) & 0xFFFFFFFF,
+            digest,
+            expires_at,
+            time.time() if data else 0.0,
+            len(data),
+        )
+        _SHM_SEQUENCE.pack_into(self._buf, offset, (sequence + 2) & 0xFFFFFFFF)
+
 
 __all__ = (
+    "DiskCache",
+    "DiskConfig",
+    "KEY_HASHERS",
+    "KeyBuilder",
+    "KeyHasher",
     "MemoryCache",
+    "MemoryConfig",
     "RedisCache",
     "RedisConfig",
+    "SharedMemoryCache",
+    "SharedMemoryConfig",
+    "TieredCache",
+    "TieredConfig",
     "AvailableKeys",
     "DEFAULT_KEY_PATTERN",
 )
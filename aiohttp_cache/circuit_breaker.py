@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+
+from typing import Any, Awaitable, Optional, TypeVar
+
+from aiohttp_cache.exceptions import BackendUnavailable
+
+
+T = TypeVar("T", bound=Any)
+
+log = logging.getLogger("aiohttp")
+
+
+class CircuitBreaker:
+    """Stop calling a failing backend for a while.
+
+    After `failure_threshold` consecutive errors or timeouts the circuit
+    opens, and the calls fail right away with `BackendUnavailable` for
+    `recovery_timeout` seconds. Then a single call probes the backend,
+    closing the circuit if it succeeds.
+
+    :param failure_threshold: consecutive failures opening the circuit
+    :param recovery_timeout: seconds before probing the backend again
+    :param timeout: seconds a call could last before being a failure,
+        `None` to wait as long as needed
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30,
+        timeout: Optional[float] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.timeout = timeout
+
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Return whether the backend could be called right now."""
+        if self._opened_at is None:
+            return True
+
+        if self._probing:
+            return False
+        if time.monotonic() - self._opened_at < self.recovery_timeout:
+            return False
+
+        self._probing = True
+        return True
+
+    async def call(self, awaitable: Awaitable[T]) -> T:
+        """Await the backend call, through the circuit."""
+        if not self.allow():
+            # Don't leak a never awaited coroutine
+            getattr(awaitable, "close", lambda: None)()
+            raise BackendUnavailable("Cache backend circuit is open")
+
+        try:
+            if self.timeout is None:
+                result = await awaitable
+            else:
+                result = await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        except Exception as e:
+            self._record_failure()
+            raise BackendUnavailable(str(e) or type(e).__name__) from e
+
+        self._record_success()
+        return result
+
+    def _record_success(self) -> None:
+        if self._opened_at is not None:
+            log.info("Cache backend recovered, closing the circuit")
+
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def _record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+
+        if self._opened_at is not None or (
+            self._failures >= self.failure_threshold
+        ):
+            if self._opened_at is None:
+                log.warning("Cache backend is failing, opening the circuit")
+            self._opened_at = time.monotonic()
+
+
+__all__ = ("CircuitBreaker",)
@@ -0,0 +1,134 @@
+import gzip
+import zlib
+
+from typing import Dict, Optional, Union
+
+from aiohttp_cache.exceptions import HTTPCache
+
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class Compressor:
+    """Compress the cached bodies, served with `encoding` as encoding."""
+
+    encoding = ""
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+
+class GzipCompressor(Compressor):
+    encoding = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data, wbits=zlib.MAX_WBITS | 16)
+
+
+class BrotliCompressor(Compressor):
+    """Brotli compressor, requires the `brotli` package."""
+
+    encoding = "br"
+
+    def __init__(self, quality: int = 5):
+        if brotli is None:
+            raise HTTPCache("brotli compression requires brotli installed")
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)  # type: ignore
+
+    def decompress(self, data: bytes) -> bytes:
+        return brotli.decompress(data)  # type: ignore
+
+
+class ZstdCompressor(Compressor):
+    """Zstandard compressor, requires the `zstandard` package."""
+
+    encoding = "zstd"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise HTTPCache("zstd compression requires zstandard installed")
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)  # type: ignore
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)  # type: ignore
+
+
+COMPRESSORS = {
+    "gzip": GzipCompressor,
+    "br": BrotliCompressor,
+    "zstd": ZstdCompressor,
+}
+
+
+def get_compressor(
+    compression: Union[str, Compressor, None]
+) -> Optional[Compressor]:
+    """Return the compressor, looking it up by encoding if needed."""
+    if compression is None or isinstance(compression, Compressor):
+        return compression
+
+    try:
+        return COMPRESSORS[compression.lower()]()  # type: ignore
+    except KeyError:
+        raise HTTPCache(
+            f"Invalid compression selected: '{compression}'. "
+            f"Available: {', '.join(COMPRESSORS)}"
+        ) from None
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse the `Accept-Encoding` header into {encoding: quality}."""
+    encodings = {}
+    for item in accept_encoding.lower().split(","):
+        encoding, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[encoding.strip()] = quality
+    return encodings
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Return whether the `Accept-Encoding` header allows the encoding."""
+    encodings = accepted_encodings(accept_encoding)
+    quality = encodings.get(encoding, encodings.get("*", 0.0))
+    return quality > 0
+
+
+__all__ = (
+    "BrotliCompressor",
+    "COMPRESSORS",
+    "Compressor",
+    "GzipCompressor",
+    "ZstdCompressor",
+    "accepts_encoding",
+    "get_compressor",
+)
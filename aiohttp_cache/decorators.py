@@ -1,18 +1,114 @@
-from typing import Any, TypeVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from aiohttp import web
+
+from aiohttp_cache.backends import AvailableKeys
+from aiohttp_cache.compression import Compressor, get_compressor
 
 
 T = TypeVar("T", bound=Any)
 
+KeyFunction = Callable[[web.Request], Union[str, Awaitable[str]]]
+
 
 class cache(object):  # noqa
-    def __init__(self, expires: int = 3600, unless: bool = False):
+    def __init__(
+        self,
+        expires: int = 3600,
+        unless: bool = False,
+        single_flight: bool = False,
+        stale_while_revalidate: int = 0,
+        stale_if_error: int = 0,
+        compression: Union[str, Compressor, bool, None] = None,
+        tags: Sequence[str] = (),
+        conditional: bool = False,
+        http_semantics: bool = False,
+        stream_max_size: int = 10 * 1024 * 1024,
+        key_pattern: Optional[Tuple[AvailableKeys, ...]] = None,
+        key: Optional[KeyFunction] = None,
+        sort_query: bool = False,
+        query_allow: Optional[Sequence[str]] = None,
+        query_deny: Sequence[str] = (),
+        key_headers: Sequence[str] = (),
+        cacheable_statuses: Optional[Collection[int]] = None,
+        max_body_size: Optional[int] = None,
+        negative_expires: Optional[int] = None,
+    ):
         self.expires = expires
         self.unless = unless
+        self.single_flight = single_flight
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.tags = tuple(tags)
+        self.conditional = conditional
+        self.http_semantics = http_semantics
+        self.stream_max_size = stream_max_size
+
+        #
+        # The key of the entries is built with `key` if set, otherwise from
+        # the key pattern of the backend, or `key_pattern`, normalized with
+        # the query and header options
+        #
+        self.key_pattern = key_pattern
+        self.key = key
+        self.key_options: Dict[str, Any] = {}
+        if sort_query:
+            self.key_options["sort_query"] = True
+        if query_allow is not None:
+            self.key_options["query_allow"] = tuple(query_allow)
+        if query_deny:
+            self.key_options["query_deny"] = tuple(query_deny)
+        if key_headers:
+            self.key_options["key_headers"] = tuple(key_headers)
+
+        #
+        # Which responses are cached, None uses the settings of the backend
+        #
+        self.cacheable_statuses = cacheable_statuses
+        self.max_body_size = max_body_size
+        self.negative_expires = negative_expires
+
+        #
+        # None uses the compression of the backend, False disables it and
+        # True compresses with gzip
+        #
+        if compression is True:
+            compression = "gzip"
+        self.compression = (
+            compression
+            if compression is None or compression is False
+            else get_compressor(compression)  # type: ignore
+        )
 
     def __call__(self, f: T) -> T:
         f.cache_enable = True
         f.cache_expires = self.expires
         f.cache_unless = self.unless
+        f.cache_single_flight = self.single_flight
+        f.cache_stale_while_revalidate = self.stale_while_revalidate
+        f.cache_stale_if_error = self.stale_if_error
+        f.cache_compression = self.compression
+        f.cache_tags = self.tags
+        f.cache_conditional = self.conditional
+        f.cache_http_semantics = self.http_semantics
+        f.cache_stream_max_size = self.stream_max_size
+        f.cache_key_pattern = self.key_pattern
+        f.cache_key = self.key
+        f.cache_key_options = self.key_options
+        f.cache_cacheable_statuses = self.cacheable_statuses
+        f.cache_max_body_size = self.max_body_size
+        f.cache_negative_expires = self.negative_expires
 
         return f
 
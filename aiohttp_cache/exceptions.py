@@ -2,4 +2,8 @@ class HTTPCache(ValueError):
     pass
 
 
-__all__ = ("HTTPCache",)
+class BackendUnavailable(HTTPCache):
+    """The cache backend failed, or its circuit breaker is open."""
+
+
+__all__ = ("BackendUnavailable", "HTTPCache")
@@ -0,0 +1,189 @@
+import bisect
+
+from collections import Counter, defaultdict
+from typing import DefaultDict, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+
+# Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# Results of the requests to the cached routes
+HIT = "hit"
+MISS = "miss"
+STALE = "stale"
+COALESCED = "coalesced"
+BYPASS = "bypass"
+RESULTS = (HIT, MISS, STALE, COALESCED, BYPASS)
+
+
+class Histogram:
+    """Count the observed values in fixed buckets."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        """Return the (upper bound, count) of the buckets, cumulated."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(
+                ("+Inf" if bound == float("inf") else str(bound), total)
+            )
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class CacheMetrics:
+    """In-process aggregator of the metrics of the cache.
+
+    Requests are counted once per route and result: `hit`, `miss`,
+    `stale`, `coalesced` (served by the response generated for another
+    request) and `bypass` (served by the handler while the backend is
+    unavailable). The latency of the handlers is observed on every call,
+    revalidations of stale entries in background included, and the latency
+    of the backend on gets and sets.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.requests: DefaultDict[str, "Counter[str]"] = defaultdict(Counter)
+        self.handler_latency: Dict[str, Histogram] = {}
+        self.backend_latency = {
+            "get": Histogram(self.buckets),
+            "set": Histogram(self.buckets),
+        }
+        self.stored_bytes = 0
+        self.evictions = 0
+
+    def count(self, route: str, result: str) -> None:
+        """Count a request to a cached route."""
+        self.requests[route][result] += 1
+
+    def observe_handler(self, route: str, seconds: float) -> None:
+        histogram = self.handler_latency.get(route)
+        if histogram is None:
+            histogram = self.handler_latency[route] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def observe_get(self, seconds: float) -> None:
+        self.backend_latency["get"].observe(seconds)
+
+    def observe_set(self, seconds: float, size: int) -> None:
+        self.backend_latency["set"].observe(seconds)
+        self.stored_bytes += size
+
+    def evicted(self, count: int = 1) -> None:
+        self.evictions += count
+
+    def hit_ratio(self, route: Optional[str] = None) -> float:
+        """Return the ratio of requests served from the cache."""
+        counters = (
+            [self.requests[route]] if route else list(self.requests.values())
+        )
+        served = sum(c[HIT] + c[STALE] + c[COALESCED] for c in counters)
+        total = served + sum(c[MISS] + c[BYPASS] for c in counters)
+        return served / total if total else 0.0
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text format."""
+        lines = [
+            "# HELP aiohttp_cache_requests_total Requests to the cached "
+            "routes, by result.",
+            "# TYPE aiohttp_cache_requests_total counter",
+        ]
+        for route, counter in sorted(self.requests.items()):
+            for result in RESULTS:
+                lines.append(
+                    f"aiohttp_cache_requests_total{{route="
+                    f'"{_escape(route)}",result="{result}"}} '
+                    f"{counter[result]}"
+                )
+
+        lines += [
+            "# HELP aiohttp_cache_handler_seconds Latency of the handlers of "
+            "the cached routes.",
+            "# TYPE aiohttp_cache_handler_seconds histogram",
+        ]
+        for route, histogram in sorted(self.handler_latency.items()):
+            lines += self._render_histogram(
+                "aiohttp_cache_handler_seconds",
+                f'route="{_escape(route)}"',
+                histogram,
+            )
+
+        lines += [
+            "# HELP aiohttp_cache_backend_seconds Latency of the cache "
+            "backend.",
+            "# TYPE aiohttp_cache_backend_seconds histogram",
+        ]
+        for operation, histogram in self.backend_latency.items():
+            lines += self._render_histogram(
+                "aiohttp_cache_backend_seconds",
+                f'operation="{operation}"',
+                histogram,
+            )
+
+        lines += [
+            "# HELP aiohttp_cache_stored_bytes_total Bytes of the bodies "
+            "stored in the cache.",
+            "# TYPE aiohttp_cache_stored_bytes_total counter",
+            f"aiohttp_cache_stored_bytes_total {self.stored_bytes}",
+            "# HELP aiohttp_cache_evictions_total Entries evicted from the "
+            "cache before their expiration.",
+            "# TYPE aiohttp_cache_evictions_total counter",
+            f"aiohttp_cache_evictions_total {self.evictions}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(
+        name: str, labels: str, histogram: Histogram
+    ) -> List[str]:
+        lines = [
+            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in histogram.cumulative_counts()
+        ]
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Serve the metrics of the cache in the Prometheus text format."""
+    metrics = request.app["cache"].metrics
+    return web.Response(
+        body=metrics.render().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+__all__ = ("CacheMetrics", "Histogram", "metrics_handler")
@@ -1,16 +1,87 @@
+import asyncio
+import contextlib
 import functools
+import hashlib
+import inspect
+import logging
+import time
+import weakref
 
-from typing import Awaitable, Callable, Type, Union
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
-from aiohttp import web
+from aiohttp import hdrs, web
 from aiohttp.abc import AbstractView, StreamResponse
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response
+from aiohttp.web_urldispatcher import AbstractRoute
+from multidict import CIMultiDict
+
+from aiohttp_cache.backends import BaseCache, KeyBuilder
+from aiohttp_cache.compression import COMPRESSORS, Compressor, accepts_encoding
+from aiohttp_cache.exceptions import BackendUnavailable, HTTPCache
+from aiohttp_cache.metrics import BYPASS, COALESCED, HIT, MISS, STALE
 
 
 _WebHandler = Callable[[Request], Awaitable[StreamResponse]]
 HandlerType = Union[_WebHandler, Type[AbstractView]]
 
+log = logging.getLogger("aiohttp")
+
+# Seconds between two checks of the cache while another process holds the
+# lock of a missed key
+LOCK_POLL_INTERVAL = 0.05
+
+# Suffix of the keys holding the validators of the conditional entries
+META_SUFFIX = ":meta"
+
+# Suffix of the keys holding the Vary index of the resources
+VARY_SUFFIX = ":vary"
+
+# Request key of the cache key of the resource, before resolving its variant
+_BASE_KEY = "aiohttp_cache_base_key"
+
+# Size of the chunks of the streamed responses stored in the cache
+STREAM_CHUNK_SIZE = 64 * 1024
+# Number of chunks read at once when streaming a cached response
+STREAM_READ_WINDOW = 4
+
+# Request key of the cache of the streamed response of the handler
+_STREAM_CACHE = "aiohttp_cache_stream"
+# The entry is not read yet, by the answer of a range request
+_NOT_READ = object()
+# Request key of the copies of the requests revalidating stale entries
+_REVALIDATION = "aiohttp_cache_revalidation"
+
+# Headers of the streamed responses set by aiohttp when they are sent
+_STREAM_SKIP_HEADERS = (
+    hdrs.CONNECTION,
+    hdrs.DATE,
+    hdrs.SERVER,
+    hdrs.TRANSFER_ENCODING,
+)
+
+# Cached bodies loaded as memoryviews are served without copying them from
+# this size, smaller ones are copied into bytes, faster to serve
+ZERO_COPY_MIN_SIZE = 16 * 1024
+
+# Statuses of the negative responses, which could have their own expiration
+NEGATIVE_STATUSES = (404, 410)
+
+# Strong references to the revalidation tasks running in background
+_background_tasks: Set["asyncio.Future[Any]"] = set()
+
 
 def get_original_handler(
     handler: Union[HandlerType, functools.partial]
@@ -36,6 +107,1192 @@ def get_original_handler(
         return handler  # type: ignore
 
 
+# Cache policies of the routes, resolved once per route
+_policies: "weakref.WeakKeyDictionary[AbstractRoute, CachePolicy]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class CachePolicy:
+    """Cache settings of a handler, set with the `cache` decorator."""
+
+    def __init__(self, handler: HandlerType, route: str = ""):
+        # Name of the route in the metrics
+        self.route = route
+        self.enabled = getattr(handler, "cache_enable", False)
+        self.unless = getattr(handler, "cache_unless", False) is True
+        self.expires = getattr(handler, "cache_expires", 300)
+        self.single_flight = getattr(handler, "cache_single_flight", False)
+        self.stale_while_revalidate = getattr(
+            handler, "cache_stale_while_revalidate", 0
+        )
+        self.stale_if_error = getattr(handler, "cache_stale_if_error", 0)
+        self.stale = max(self.stale_while_revalidate, self.stale_if_error)
+        self.compression = getattr(handler, "cache_compression", None)
+        self.tags = getattr(handler, "cache_tags", ())
+        self.conditional = getattr(handler, "cache_conditional", False)
+        self.http_semantics = getattr(handler, "cache_http_semantics", False)
+        self.stream_max_size = getattr(handler, "cache_stream_max_size", 0)
+        self.key_function = getattr(handler, "cache_key", None)
+        self.key_pattern = getattr(handler, "cache_key_pattern", None)
+        self.key_options = getattr(handler, "cache_key_options", {})
+        self.cacheable_statuses = getattr(
+            handler, "cache_cacheable_statuses", None
+        )
+        self.max_body_size = getattr(handler, "cache_max_body_size", None)
+        self.negative_expires = getattr(
+            handler, "cache_negative_expires", None
+        )
+
+        # Built on first use, with the key settings of the backend
+        self._key_builder: Optional[KeyBuilder] = None
+
+    async def make_key(
+        self, request: web.Request, cache_backend: BaseCache
+    ) -> str:
+        """Return the cache key of the request."""
+        if self.key_function is not None:
+            key = self.key_function(request)
+            if inspect.isawaitable(key):
+                key = await key
+            return key  # type: ignore
+
+        if self.key_pattern is None and not self.key_options:
+            return await cache_backend.make_key(request)
+
+        if self._key_builder is None:
+            self._key_builder = KeyBuilder(
+                self.key_pattern or cache_backend.key_pattern,
+                cache_backend.encrypt_key,
+                cache_backend.key_hasher,
+                **self.key_options,
+            )
+        return await self._key_builder(request)
+
+    def is_cacheable(self, status: int, cache_backend: BaseCache) -> bool:
+        """Return whether responses with this status could be cached.
+
+        Partial responses are never cached.
+        """
+        if status == web.HTTPPartialContent.status_code:
+            return False
+        statuses = self.cacheable_statuses
+        if statuses is None:
+            statuses = cache_backend.cacheable_statuses
+        return statuses is None or status in statuses
+
+    def body_size_limit(self, cache_backend: BaseCache) -> Optional[int]:
+        """Return the maximum size of the cached bodies, if any."""
+        if self.max_body_size is None:
+            return cache_backend.max_body_size
+        return self.max_body_size  # type: ignore
+
+    def expires_of(self, status: int, cache_backend: BaseCache) -> int:
+        """Return the expiration of the responses with this status."""
+        if status in NEGATIVE_STATUSES:
+            negative = self.negative_expires
+            if negative is None:
+                negative = cache_backend.negative_expiration
+            if negative is not None:
+                return negative  # type: ignore
+        return self.expires  # type: ignore
+
+    def compressor(self, cache_backend: BaseCache) -> Optional[Compressor]:
+        """Return the compressor of the cached bodies, if any."""
+        if self.compression is None:
+            return cache_backend.compressor
+        return self.compression or None  # type: ignore
+
+
+# Policy of the requests matching no route, they are never cached
+_NO_ROUTE_POLICY = CachePolicy(None)  # type: ignore
+
+
+def get_policy(request: web.Request, handler: HandlerType) -> CachePolicy:
+    """Return the cache policy of the route of the request."""
+    if request.match_info.http_exception is not None:
+        # A 404 or 405 error, with a new route per request
+        return _NO_ROUTE_POLICY
+
+    route = request.match_info.route
+    policy = _policies.get(route)
+    if policy is None:
+        policy = _policies[route] = CachePolicy(
+            get_original_handler(handler), _route_name(route)
+        )
+    return policy
+
+
+async def resolve_cache_policies(app: web.Application) -> None:
+    """Resolve the cache policies of the routes of the application.
+
+    Connected to the `on_startup` signal, once the router is frozen. The
+    routes of the sub-applications are resolved on their first request.
+    """
+    for route in app.router.routes():
+        _policies[route] = CachePolicy(
+            get_original_handler(route.handler), _route_name(route)
+        )
+
+
+def _route_name(route: AbstractRoute) -> str:
+    resource = route.resource
+    return f"{route.method} {resource.canonical if resource else ''}"
+
+
+# --------------------------------------------------------------------------
+# METRICS
+# --------------------------------------------------------------------------
+def _count(
+    request: web.Request,
+    cache_backend: BaseCache,
+    policy: CachePolicy,
+    result: str,
+) -> None:
+    """Count the result of a request, if metrics are enabled.
+
+    Revalidations in background are not requests of the clients, they are
+    not counted.
+    """
+    if cache_backend.metrics is not None and not request.get(_REVALIDATION):
+        cache_backend.metrics.count(policy.route, result)
+
+
+async def _call_handler(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    policy: CachePolicy,
+    result: Optional[str] = MISS,
+) -> StreamResponse:
+    """Call the handler, observing its latency and counting the result."""
+    metrics = cache_backend.metrics
+    if metrics is None:
+        return await handler(request)
+
+    start = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        metrics.observe_handler(policy.route, time.perf_counter() - start)
+        if result is not None:
+            _count(request, cache_backend, policy, result)
+
+
+async def _get(cache_backend: BaseCache, key: str) -> Optional[Any]:
+    """Get the entry from the backend, observing its latency."""
+    metrics = cache_backend.metrics
+    if metrics is None:
+        return await cache_backend.get(key)
+
+    start = time.perf_counter()
+    try:
+        return await cache_backend.get(key)
+    finally:
+        metrics.observe_get(time.perf_counter() - start)
+
+
+@functools.lru_cache(maxsize=None)
+def _default_decompressor(encoding: str) -> Optional[Compressor]:
+    compressor_class = COMPRESSORS.get(encoding)
+    if compressor_class is None:
+        return None
+    try:
+        return compressor_class()
+    except HTTPCache:
+        # Its package isn't installed
+        return None
+
+
+def _decompressor(request: web.Request, encoding: str) -> Optional[Compressor]:
+    """Return the compressor of the encoding of a cached body, if any.
+
+    The compressor of the route is used first, it could be a custom one.
+    """
+    policy = _policies.get(request.match_info.route)
+    if policy is not None:
+        compressor = policy.compressor(request.app["cache"])
+        if compressor is not None and compressor.encoding == encoding:
+            return compressor
+    return _default_decompressor(encoding)
+
+
+def _is_decodable(request: web.Request, cached_response: dict) -> bool:
+    """Return whether the cached body could be served to the client."""
+    encoding = cached_response.get("content_encoding")
+    return (
+        encoding is None
+        or accepts_encoding(
+            request.headers.get(hdrs.ACCEPT_ENCODING, ""), encoding
+        )
+        or _decompressor(request, encoding) is not None
+    )
+
+
+def _response_body(body: Any) -> Any:
+    """Return the body to build a response, copying only small bodies.
+
+    aiohttp wraps bodies other than bytes into a payload, which costs more
+    than copying a small body.
+    """
+    if isinstance(body, memoryview) and len(body) < ZERO_COPY_MIN_SIZE:
+        return bytes(body)
+    return body
+
+
+def _make_response(request: web.Request, cached_response: dict) -> Response:
+    """Build the response of a cache entry.
+
+    Compressed bodies are served as they are if the client accepts their
+    encoding, otherwise they are decompressed.
+    """
+    body = _response_body(cached_response["body"])
+    encoding = cached_response.get("content_encoding")
+    if encoding is None:
+        return web.Response(
+            status=cached_response["status"],
+            headers=cached_response["headers"],
+            body=body,
+        )
+
+    accepted = accepts_encoding(
+        request.headers.get(hdrs.ACCEPT_ENCODING, ""), encoding
+    )
+    if not accepted:
+        decompressor = _decompressor(request, encoding)
+        if decompressor is None:
+            raise HTTPCache(f"No compressor of the encoding '{encoding}'")
+        body = decompressor.decompress(body)
+
+    response = web.Response(
+        status=cached_response["status"],
+        headers=cached_response["headers"],
+        body=body,
+    )
+    if accepted:
+        response.headers[hdrs.CONTENT_ENCODING] = encoding
+        etag = response.headers.get(hdrs.ETAG)
+        if etag is not None:
+            response.headers[hdrs.ETAG] = _encoded_etag(etag, encoding)
+    response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+
+    return response
+
+
+# --------------------------------------------------------------------------
+# CONDITIONAL REQUESTS
+# --------------------------------------------------------------------------
+def _make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _encoded_etag(etag: str, encoding: str) -> str:
+    """Return the ETag of the body served compressed with `encoding`."""
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def _etag_matches(if_none_match: str, etags: Sequence[str]) -> bool:
+    """Weak comparison of `If-None-Match` against the ETags of the entry."""
+    opaque_tags = {
+        etag[2:] if etag.startswith("W/") else etag for etag in etags
+    }
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in opaque_tags:
+            return True
+    return False
+
+
+def _is_not_modified(request: web.Request, meta: dict) -> bool:
+    """Return whether the client copy of the entry is still valid.
+
+    `If-None-Match` takes precedence over `If-Modified-Since`.
+    """
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if if_none_match is not None:
+        etag = meta.get("etag")
+        if etag is None:
+            return False
+        etags = [etag]
+        if meta.get("content_encoding"):
+            etags.append(_encoded_etag(etag, meta["content_encoding"]))
+        return _etag_matches(if_none_match, etags)
+
+    if_modified_since = request.if_modified_since
+    last_modified = meta.get("last_modified")
+    if if_modified_since is None or last_modified is None:
+        return False
+    return last_modified <= if_modified_since.timestamp()
+
+
+def _make_not_modified(request: web.Request, meta: dict) -> Response:
+    """Build the bodyless 304 response of an entry."""
+    response = web.Response(status=304)
+    etag = meta.get("etag")
+    encoding = meta.get("content_encoding")
+    if encoding is not None:
+        if etag is not None and accepts_encoding(
+            request.headers.get(hdrs.ACCEPT_ENCODING, ""), encoding
+        ):
+            etag = _encoded_etag(etag, encoding)
+        response.headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+    if etag is not None:
+        response.headers[hdrs.ETAG] = etag
+    if meta.get("last_modified") is not None:
+        response.last_modified = meta["last_modified"]
+    return response
+
+
+async def _get_not_modified(
+    request: web.Request, cache_backend: BaseCache, key: str
+) -> Optional[Response]:
+    """Answer a conditional request only with the validators of the entry.
+
+    The body is not loaded from the backend, only whether it still exists.
+    Returns None if the request must be served as usual.
+    """
+    meta = await cache_backend.get(key + META_SUFFIX)
+    if not meta or _is_expired(meta) or not _is_not_modified(request, meta):
+        return None
+
+    # The entry could be gone while its validators are not
+    if not await cache_backend.has(key):
+        return None
+
+    return _make_not_modified(request, meta)
+
+
+def _is_expired(cached_response: dict) -> bool:
+    expires_at = cached_response.get("expires_at")
+    return expires_at is not None and expires_at < time.time()
+
+
+def _spawn(coro: Awaitable[None]) -> None:
+    """Run the coroutine in background, keeping a reference to its task."""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+# --------------------------------------------------------------------------
+# RANGE REQUESTS
+# --------------------------------------------------------------------------
+def _parse_range(header: str) -> Optional[Tuple[int, Optional[int]]]:
+    """Parse a single byte range as the start and stop of a slice.
+
+    Returns None for invalid or multiple ranges, which are ignored.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep:
+            return None
+        if not first:
+            suffix = int(last)
+            return (-suffix, None) if suffix > 0 else None
+        start = int(first)
+        stop = int(last) + 1 if last else None
+    except ValueError:
+        return None
+
+    if start < 0 or (stop is not None and stop <= start):
+        return None
+    return start, stop
+
+
+def _if_range_matches(request: web.Request, cached_response: dict) -> bool:
+    """Return whether the `If-Range` validator matches the cached entry."""
+    if_range = request.headers.get(hdrs.IF_RANGE)
+    if if_range is None:
+        return True
+
+    headers = CIMultiDict(cached_response["headers"])
+    if if_range.startswith(('"', "W/")):
+        # Strong comparison, weak ETags never match
+        return headers.get(hdrs.ETAG) == if_range and if_range[0] == '"'
+    return headers.get(hdrs.LAST_MODIFIED) == if_range
+
+
+async def _get_range(
+    request: web.Request, cache_backend: BaseCache, key: str
+) -> Tuple[Optional[Response], Any]:
+    """Answer a range request with a slice of the cached body.
+
+    Only the range is read from backends supporting it. Returns the 206
+    response and `_NOT_READ`, or None if the request should be served the
+    whole response: invalid or multiple ranges, `If-Range` not matching,
+    compressed or not fresh entries. Entries read whole, or missing, are
+    returned along to be served without reading them again.
+    """
+    byte_range = _parse_range(request.headers[hdrs.RANGE])
+    if byte_range is None:
+        return None, _NOT_READ
+
+    result = await cache_backend.get_range(key, *byte_range)
+    if result is None:
+        return None, None
+
+    cached_response, size = result
+    if size is None:
+        # Not a response with a body, read whole
+        return None, cached_response
+    if (
+        cached_response.get("status") != 200
+        or "content_encoding" in cached_response
+        or _is_expired(cached_response)
+        or not _if_range_matches(request, cached_response)
+    ):
+        return None, _NOT_READ
+
+    start, end, _ = slice(*byte_range).indices(size)
+    if start >= end:
+        not_satisfiable = web.Response(
+            status=web.HTTPRequestRangeNotSatisfiable.status_code,
+            headers={hdrs.CONTENT_RANGE: f"bytes */{size}"},
+        )
+        return not_satisfiable, _NOT_READ
+
+    headers = CIMultiDict(cached_response["headers"])
+    headers.pop(hdrs.CONTENT_LENGTH, None)
+    headers[hdrs.CONTENT_RANGE] = f"bytes {start}-{end - 1}/{size}"
+    partial = web.Response(
+        status=web.HTTPPartialContent.status_code,
+        headers=headers,
+        body=_response_body(cached_response["body"]),
+    )
+    return partial, _NOT_READ
+
+
+# --------------------------------------------------------------------------
+# CACHE-CONTROL AND VARY
+# --------------------------------------------------------------------------
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """Parse the `Cache-Control` header into {directive: argument}."""
+    directives: Dict[str, Optional[str]] = {}
+    for item in value.split(","):
+        name, _, argument = item.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip('"') or None
+    return directives
+
+
+def _response_expires(
+    original_response: StreamResponse,
+    policy: CachePolicy,
+    cache_backend: BaseCache,
+) -> Optional[int]:
+    """Return the seconds the response could be cached, None if it can't.
+
+    Responses with a status which is not cacheable are not cached, and
+    negative responses could have their own expiration. An expiration of
+    0 caches the response without expiration.
+
+    With `http_semantics`, `no-store`, `private`, `no-cache` and
+    `max-age=0` responses are not cached, and `s-maxage` or `max-age`
+    replace the expiration of the decorator.
+    """
+    status = original_response.status
+    if not policy.is_cacheable(status, cache_backend):
+        return None
+
+    expires = policy.expires_of(status, cache_backend)
+    if not policy.http_semantics:
+        return expires
+
+    directives = _parse_cache_control(
+        original_response.headers.get(hdrs.CACHE_CONTROL, "")
+    )
+    if {"no-store", "private", "no-cache"} & directives.keys():
+        return None
+
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                max_age = int(directives[name] or "")
+            except ValueError:
+                return None
+            return max_age if max_age > 0 else None
+
+    return expires
+
+
+def _vary_headers(original_response: StreamResponse) -> List[str]:
+    """Return the lowercase names of the `Vary` headers of the response."""
+    return sorted(
+        {
+            name.strip().lower()
+            for value in original_response.headers.getall(hdrs.VARY, ())
+            for name in value.split(",")
+            if name.strip()
+        }
+    )
+
+
+def _variant_key(request: web.Request, key: str, vary: List[str]) -> str:
+    """Return the key of the variant of the resource for the request."""
+    values = "\n".join(
+        ",".join(request.headers.getall(name, ())) for name in vary
+    )
+    digest = hashlib.blake2b(values.encode("utf-8"), digest_size=16)
+    return f"{key}:{digest.hexdigest()}"
+
+
+async def _resolve_variant(
+    request: web.Request, cache_backend: BaseCache, key: str
+) -> str:
+    """Return the key of the cached variant for the request.
+
+    Resources varying on request headers keep the list of headers in a
+    small index, read before the entry.
+    """
+    request[_BASE_KEY] = key
+    index = await cache_backend.get(key + VARY_SUFFIX)
+    if not index:
+        return key
+    return _variant_key(request, key, index["vary"])
+
+
+# --------------------------------------------------------------------------
+# STREAMED RESPONSES
+# --------------------------------------------------------------------------
+def _chunk_key(key: str, index: int) -> str:
+    return f"{key}:chunk:{index}"
+
+
+class _StreamCache:
+    """Store the chunks written to a streamed response as they are sent.
+
+    The body is stored in chunks of `STREAM_CHUNK_SIZE` bytes, and the
+    entry, holding the number of chunks, once the response is complete.
+    Bodies bigger than `stream_max_size`, or than the maximum body size,
+    are not cached.
+    """
+
+    def __init__(
+        self, cache_backend: BaseCache, key: str, policy: CachePolicy
+    ):
+        self.cache_backend = cache_backend
+        self.key = key
+        self.policy = policy
+
+        self._max_size = policy.stream_max_size
+        max_body_size = policy.body_size_limit(cache_backend)
+        if max_body_size is not None:
+            self._max_size = min(self._max_size, max_body_size)
+
+        self._entry: Optional[dict] = None
+        self._expires = 0
+        self._buffer = bytearray()
+        self._size = 0
+        self._chunks = 0
+        self._done = False
+
+    def install(self, response: StreamResponse) -> None:
+        """Tee the writes of the response into the cache."""
+        expires = _response_expires(response, self.policy, self.cache_backend)
+        if expires is None or (
+            self.policy.http_semantics and _vary_headers(response)
+        ):
+            return
+
+        headers = dict(response.headers)
+        for name in _STREAM_SKIP_HEADERS:
+            headers.pop(name, None)
+        if response.compression:
+            # The compression is applied after the tee
+            headers.pop(hdrs.CONTENT_ENCODING, None)
+            headers.pop(hdrs.CONTENT_LENGTH, None)
+
+        self._entry = {
+            "status": response.status,
+            "headers": headers,
+            "body": None,
+        }
+        self._expires = self.cache_backend._calculate_expires(expires)
+
+        write, write_eof = response.write, response.write_eof
+
+        async def tee_write(data: Union[bytes, bytearray, memoryview]) -> None:
+            await write(data)
+            await self.feed(data)
+
+        async def tee_write_eof(data: bytes = b"") -> None:
+            await write_eof(data)
+            if data:
+                await self.feed(data)
+            await self.finish()
+
+        response.write = tee_write  # type: ignore
+        response.write_eof = tee_write_eof  # type: ignore
+
+    async def feed(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        if self._done:
+            return
+
+        self._size += len(data)
+        if self._size > self._max_size:
+            log.debug("Streamed response %s is too big to cache", self.key)
+            await self._abort()
+            return
+
+        self._buffer += data
+        while len(self._buffer) >= STREAM_CHUNK_SIZE:
+            chunk = bytes(self._buffer[:STREAM_CHUNK_SIZE])
+            del self._buffer[:STREAM_CHUNK_SIZE]
+            await self._store_chunk(chunk)
+
+    async def finish(self) -> None:
+        if self._done:
+            return
+
+        if self._buffer:
+            await self._store_chunk(bytes(self._buffer))
+            self._buffer.clear()
+        if self._done or self._entry is None:
+            return
+        self._done = True
+
+        self._entry["chunks"] = self._chunks
+        try:
+            # Backends could drop the values which don't fit
+            stored = await self.cache_backend.has_many(
+                [_chunk_key(self.key, i) for i in range(self._chunks)]
+            )
+            if not all(stored):
+                log.debug("Chunks of %s not cached, not caching it", self.key)
+                await self._abort()
+                return
+            await self.cache_backend.set(self.key, self._entry, self._expires)
+            if self.policy.tags:
+                await self.cache_backend.add_tags(
+                    self.key, self.policy.tags, self._expires
+                )
+        except BackendUnavailable:
+            log.debug("Cache backend unavailable, not caching %s", self.key)
+
+    async def _store_chunk(self, chunk: bytes) -> None:
+        try:
+            start = time.perf_counter()
+            await self.cache_backend.set(
+                _chunk_key(self.key, self._chunks), chunk, self._expires
+            )
+        except BackendUnavailable:
+            log.debug("Cache backend unavailable, not caching %s", self.key)
+            self._done = True
+            return
+        self._chunks += 1
+
+        metrics = self.cache_backend.metrics
+        if metrics is not None:
+            metrics.observe_set(time.perf_counter() - start, len(chunk))
+
+    async def _abort(self) -> None:
+        self._done = True
+        self._buffer.clear()
+        try:
+            await self.cache_backend.delete_many(
+                [_chunk_key(self.key, i) for i in range(self._chunks)]
+            )
+        except BackendUnavailable:
+            pass
+
+
+async def tee_streamed_response(
+    request: web.Request, response: StreamResponse
+) -> None:
+    """Cache the streamed response of a cached handler as it is sent.
+
+    Connected to the `on_response_prepare` signal of the application.
+    """
+    stream_cache = request.get(_STREAM_CACHE)
+    if (
+        stream_cache is None
+        or isinstance(response, (web.Response, web.FileResponse))
+        or stream_cache._entry is not None
+    ):
+        return
+    stream_cache.install(response)
+
+
+async def _stream_cached(
+    request: web.Request,
+    cache_backend: BaseCache,
+    key: str,
+    cached_response: dict,
+) -> Optional[StreamResponse]:
+    """Stream the chunks of a cached streamed response.
+
+    The chunks are checked before the response is started, and read
+    `STREAM_READ_WINDOW` at a time while it is sent. If any of them is gone
+    before the start, the entry is deleted and None is returned. If one is
+    evicted while streaming, the entry is deleted and the connection is
+    aborted.
+    """
+    chunk_keys = [
+        _chunk_key(key, index) for index in range(cached_response["chunks"])
+    ]
+    if not all(await cache_backend.has_many(chunk_keys)):
+        # Evicted, the response can't be completed
+        await cache_backend.delete_many([key, *chunk_keys])
+        return None
+
+    response = web.StreamResponse(
+        status=cached_response["status"], headers=cached_response["headers"]
+    )
+    await response.prepare(request)
+    try:
+        for start in range(0, len(chunk_keys), STREAM_READ_WINDOW):
+            window = chunk_keys[start : start + STREAM_READ_WINDOW]
+            for chunk in await cache_backend.get_many(window):
+                if chunk is None:
+                    raise HTTPCache(f"Chunk of the entry {key} evicted")
+                await response.write(chunk)
+    except (HTTPCache, BackendUnavailable):
+        log.warning("Aborting the cached streamed response %s", key)
+        if request.transport is not None:
+            request.transport.abort()
+        with contextlib.suppress(BackendUnavailable):
+            await cache_backend.delete_many([key, *chunk_keys])
+        return response
+
+    await response.write_eof()
+    return response
+
+
+def _store_variant(
+    request: web.Request,
+    key: str,
+    original_response: StreamResponse,
+    items: Dict[str, Any],
+) -> Tuple[Optional[str], List[str]]:
+    """Return the key of the variant of the response and its Vary headers.
+
+    The Vary index of the resource is added to the stored items. The key
+    is None if the response varies on anything.
+    """
+    vary = _vary_headers(original_response)
+    if "*" in vary:
+        return None, vary
+
+    base_key = request.get(_BASE_KEY, key)
+    if not vary:
+        return base_key, vary
+    items[base_key + VARY_SUFFIX] = {"vary": vary}
+    return _variant_key(request, base_key, vary), vary
+
+
+def _compress(
+    data: Dict[str, Any],
+    original_response: StreamResponse,
+    policy: CachePolicy,
+    cache_backend: BaseCache,
+) -> None:
+    """Compress the body of the entry, if enabled and worth it."""
+    compressor = policy.compressor(cache_backend)
+    if (
+        compressor is not None
+        and isinstance(data["body"], (bytes, bytearray))
+        and len(data["body"]) >= cache_backend.compression_min_size
+        and hdrs.CONTENT_ENCODING not in original_response.headers
+    ):
+        data["body"] = compressor.compress(bytes(data["body"]))
+        data["content_encoding"] = compressor.encoding
+        headers = CIMultiDict(data["headers"])
+        headers.popall(hdrs.CONTENT_LENGTH, None)
+        data["headers"] = dict(headers)
+
+
+def _validators(
+    data: Dict[str, Any], original_response: StreamResponse
+) -> Dict[str, Any]:
+    """Return the validators of the entry, stored in their own key."""
+    last_modified = original_response.last_modified
+    meta = {
+        "etag": original_response.headers[hdrs.ETAG],
+        "last_modified": last_modified.timestamp() if last_modified else None,
+    }
+    for name in ("content_encoding", "expires_at"):
+        if name in data:
+            meta[name] = data[name]
+    return meta
+
+
+async def _write_items(
+    cache_backend: BaseCache,
+    key: str,
+    items: Dict[str, Any],
+    expires: int,
+    policy: CachePolicy,
+) -> None:
+    """Write the entry, and its companion items, in the backend."""
+    data = items[key]
+    try:
+        start = time.perf_counter()
+        if len(items) == 1:
+            await cache_backend.set(key, data, expires)
+        else:
+            await cache_backend.set_many(items, expires)
+        if cache_backend.metrics is not None:
+            cache_backend.metrics.observe_set(
+                time.perf_counter() - start, len(data["body"] or b"")
+            )
+        if policy.tags:
+            for item_key in items:
+                await cache_backend.add_tags(item_key, policy.tags, expires)
+    except BackendUnavailable:
+        log.debug("Cache backend unavailable, not caching %s", key)
+
+
+async def _store(
+    request: web.Request,
+    cache_backend: BaseCache,
+    key: str,
+    original_response: StreamResponse,
+    policy: CachePolicy,
+) -> Optional[dict]:
+    """Store the response in the cache.
+
+    Responses with a status which is not cacheable, or a body bigger than
+    the maximum body size, are not stored.
+
+    Entries which could be served stale after their expiration keep their
+    expiration date, and are kept in the backend until the end of the
+    stale window. Bodies are compressed once here, if enabled.
+
+    Conditional entries get an ETag and Last-Modified, if the handler did
+    not set them, and their validators are stored in their own key.
+
+    With `http_semantics`, responses varying on request headers are stored
+    as variants of the resource, listed in its Vary index.
+
+    Streamed responses are stored while they are sent, not here.
+
+    Returns the entry, None if it can't be served to other requests.
+    """
+    if not isinstance(original_response, web.Response):
+        return None
+
+    expires = _response_expires(original_response, policy, cache_backend)
+    if expires is None:
+        return None
+
+    body = original_response.body  # type: ignore
+    max_body_size = policy.body_size_limit(cache_backend)
+    if (
+        max_body_size is not None
+        and isinstance(body, (bytes, bytearray))
+        and len(body) > max_body_size
+    ):
+        return None
+
+    items: Dict[str, Any] = {}
+    vary: List[str] = []
+    if policy.http_semantics:
+        variant_key, vary = _store_variant(
+            request, key, original_response, items
+        )
+        if variant_key is None:
+            return None
+        key = variant_key
+
+    if policy.conditional and isinstance(body, bytes):
+        if hdrs.ETAG not in original_response.headers:
+            original_response.headers[hdrs.ETAG] = _make_etag(body)
+        if hdrs.LAST_MODIFIED not in original_response.headers:
+            original_response.last_modified = time.time()
+
+    data: Dict[str, Any] = {
+        "status": original_response.status,
+        "headers": dict(original_response.headers),
+        "body": original_response.body,
+    }
+    _compress(data, original_response, policy, cache_backend)
+
+    expires = cache_backend._calculate_expires(expires)
+    if policy.stale and expires:
+        data["expires_at"] = time.time() + expires
+        expires += policy.stale
+
+    items[key] = data
+    if policy.conditional and hdrs.ETAG in original_response.headers:
+        items[key + META_SUFFIX] = _validators(data, original_response)
+
+    await _write_items(cache_backend, key, items, expires, policy)
+
+    return None if vary else data
+
+
+async def _generate(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+) -> Tuple[StreamResponse, Optional[dict]]:
+    """Call the handler and store its response in the cache."""
+    if policy.stream_max_size:
+        request[_STREAM_CACHE] = _StreamCache(cache_backend, key, policy)
+    original_response = await _call_handler(
+        request, handler, cache_backend, policy
+    )
+
+    data = await _store(request, cache_backend, key, original_response, policy)
+
+    return original_response, data
+
+
+async def _generate_locked(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+) -> Tuple[StreamResponse, Optional[dict]]:
+    """Generate the cache holding the lock of the backend for the key.
+
+    If another process holds the lock, wait for it to fill the cache
+    instead of calling the handler, up to the lock timeout.
+    """
+    lock_timeout = cache_backend.lock_timeout
+    if lock_timeout is None:
+        return await _generate(request, handler, cache_backend, key, policy)
+
+    try:
+        locked = await cache_backend.acquire_lock(key)
+    except BackendUnavailable:
+        return await _generate(request, handler, cache_backend, key, policy)
+
+    if locked:
+        try:
+            return await _generate(
+                request, handler, cache_backend, key, policy
+            )
+        finally:
+            try:
+                await cache_backend.release_lock(key)
+            except BackendUnavailable:
+                pass
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lock_timeout
+    while loop.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+        try:
+            cached_response = await cache_backend.get(key)
+        except BackendUnavailable:
+            break
+        if cached_response and "chunks" in cached_response:
+            response = await _stream_cached(
+                request, cache_backend, key, cached_response
+            )
+            if response is None:
+                break
+            _count(request, cache_backend, policy, COALESCED)
+            return response, None
+        if cached_response and not _is_expired(cached_response):
+            _count(request, cache_backend, policy, COALESCED)
+            return _make_response(request, cached_response), cached_response
+
+    # The lock holder is too slow or died, don't wait any longer
+    return await _generate(request, handler, cache_backend, key, policy)
+
+
+async def _generate_single_flight(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+) -> StreamResponse:
+    """Generate the cache once for all the concurrent misses of a key.
+
+    The first request calls the handler and the others wait for its
+    response. If the handler fails, waiting requests call it on their own.
+    """
+    in_flight = cache_backend.in_flight
+
+    waiter = in_flight.get(key)
+    if waiter is not None:
+        cached_response = await asyncio.shield(waiter)
+        if cached_response is not None:
+            _count(request, cache_backend, policy, COALESCED)
+            return _make_response(request, cached_response)
+        return await _call_handler(request, handler, cache_backend, policy)
+
+    waiter = asyncio.get_running_loop().create_future()
+    in_flight[key] = waiter
+    data: Optional[dict] = None
+    try:
+        original_response, data = await _generate_locked(
+            request, handler, cache_backend, key, policy
+        )
+    finally:
+        del in_flight[key]
+        waiter.set_result(data)
+
+    return original_response
+
+
+async def _revalidate(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+) -> None:
+    """Refresh a stale entry in background, on a copy of the request."""
+    request[_REVALIDATION] = True
+    try:
+        await _generate_single_flight(
+            request, handler, cache_backend, key, policy
+        )
+    except Exception:
+        log.exception("Error revalidating the cache entry %s", key)
+
+
+async def _generate_if_error(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+    cached_response: dict,
+) -> StreamResponse:
+    """Call the handler, but serve the stale entry if it fails."""
+    try:
+        original_response = await _call_handler(
+            request, handler, cache_backend, policy, None
+        )
+    except web.HTTPException as e:
+        if e.status < 500:
+            _count(request, cache_backend, policy, MISS)
+            raise
+        _count(request, cache_backend, policy, STALE)
+        return _make_response(request, cached_response)
+    except Exception:
+        log.exception("Serving stale cache entry %s", key)
+        _count(request, cache_backend, policy, STALE)
+        return _make_response(request, cached_response)
+
+    if original_response.status >= 500:
+        _count(request, cache_backend, policy, STALE)
+        return _make_response(request, cached_response)
+
+    _count(request, cache_backend, policy, MISS)
+    await _store(request, cache_backend, key, original_response, policy)
+
+    return original_response
+
+
+async def _get_partial(
+    request: web.Request,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+) -> Tuple[Optional[StreamResponse], Any]:
+    """Answer conditional and range requests, without loading the body.
+
+    Returns None if the request needs the whole entry, along with the
+    entry if it was read, `_NOT_READ` otherwise.
+    """
+    if (
+        policy.conditional
+        and request.method in (hdrs.METH_GET, hdrs.METH_HEAD)
+        and (
+            hdrs.IF_NONE_MATCH in request.headers
+            or hdrs.IF_MODIFIED_SINCE in request.headers
+        )
+    ):
+        not_modified = await _get_not_modified(request, cache_backend, key)
+        if not_modified is not None:
+            return not_modified, _NOT_READ
+
+    if (
+        request.method == hdrs.METH_GET
+        and hdrs.RANGE in request.headers
+        # Compressed or stale entries are served whole, read them once
+        and policy.compressor(cache_backend) is None
+        and not policy.stale
+    ):
+        return await _get_range(request, cache_backend, key)
+    return None, _NOT_READ
+
+
+async def _serve_stale(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+    cached_response: dict,
+) -> Optional[StreamResponse]:
+    """Answer with an expired entry, if it is still in a stale window.
+
+    Returns None if the entry is too old to be served.
+    """
+    age = time.time() - cached_response["expires_at"]
+    # A request with a body can't be copied once read, the handler would
+    # run on a request already answered.
+    if age <= policy.stale_while_revalidate and not request.body_exists:
+        if key not in cache_backend.in_flight:
+            _spawn(
+                _revalidate(
+                    request.clone(), handler, cache_backend, key, policy
+                )
+            )
+        _count(request, cache_backend, policy, STALE)
+        return _make_response(request, cached_response)
+
+    if age <= policy.stale_if_error:
+        return await _generate_if_error(
+            request, handler, cache_backend, key, policy, cached_response
+        )
+    return None
+
+
+async def _serve_cached(
+    request: web.Request,
+    handler: HandlerType,
+    cache_backend: BaseCache,
+    key: str,
+    policy: CachePolicy,
+    cached_response: dict,
+) -> Optional[StreamResponse]:
+    """Answer with the cached entry.
+
+    Returns None if the entry can't be served, and must be generated again.
+    """
+    if not _is_decodable(request, cached_response):
+        # Compressed by a compressor unknown here
+        return None
+
+    if "chunks" in cached_response:
+        response = await _stream_cached(
+            request, cache_backend, key, cached_response
+        )
+        if response is not None:
+            _count(request, cache_backend, policy, HIT)
+        return response
+    if not _is_expired(cached_response):
+        _count(request, cache_backend, policy, HIT)
+        return _make_response(request, cached_response)
+
+    return await _serve_stale(
+        request, handler, cache_backend, key, policy, cached_response
+    )
+
+
 @web.middleware
 async def cache_middleware(
     request: web.Request, handler: HandlerType
@@ -46,44 +1303,71 @@ async def cache_middleware(
     If yes, it caches the response using the caching
     backend and on the next call retrieve the response
     from the caching backend.
-    """
-
-    original_handler = get_original_handler(handler)
 
-    if getattr(original_handler, "cache_enable", False):
-        #
-        # Cache is disabled?
-        #
-        if getattr(original_handler, "cache_unless", False) is True:
-            return await handler(request)
+    Expired entries could be served stale while they are refreshed in
+    background (`stale_while_revalidate`) or when the handler fails
+    (`stale_if_error`). With `http_semantics`, the `Cache-Control` and
+    `Vary` headers of the responses are honoured. Conditional requests are
+    answered with a 304 from the validators of the entry. The cache is
+    skipped while its backend is unavailable.
+    """
 
-        cache_backend = request.app["cache"]
+    policy = get_policy(request, handler)
 
-        key = await cache_backend.make_key(request)
+    # Not cached, or cache disabled
+    if not policy.enabled or policy.unless:
+        return await handler(request)
 
-        cached_response = await cache_backend.get(key)
-        if cached_response:
-            return web.Response(**cached_response)
+    cache_backend = request.app["cache"]
 
-        #
-        # Generate cache
-        #
-        original_response = await handler(request)
+    key = await policy.make_key(request, cache_backend)
 
-        data = {
-            "status": original_response.status,
-            "headers": dict(original_response.headers),
-            "body": original_response.body,
-        }
+    try:
+        if policy.http_semantics:
+            key = await _resolve_variant(request, cache_backend, key)
+        partial, cached_response = await _get_partial(
+            request, cache_backend, key, policy
+        )
+        if partial is None and cached_response is _NOT_READ:
+            cached_response = await _get(cache_backend, key)
+    except BackendUnavailable:
+        # Skip the cache, the backend is failing
+        return await _call_handler(
+            request, handler, cache_backend, policy, BYPASS
+        )
+    if partial is not None:
+        _count(request, cache_backend, policy, HIT)
+        return partial
 
-        expires = getattr(original_handler, "cache_expires", 300)
+    if cached_response:
+        try:
+            response = await _serve_cached(
+                request, handler, cache_backend, key, policy, cached_response
+            )
+        except BackendUnavailable:
+            return await _call_handler(
+                request, handler, cache_backend, policy, BYPASS
+            )
+        if response is not None:
+            return response
 
-        await cache_backend.set(key, data, expires)
+    #
+    # Generate cache
+    #
+    if policy.single_flight:
+        return await _generate_single_flight(
+            request, handler, cache_backend, key, policy
+        )
 
-        return original_response
+    original_response, _ = await _generate(
+        request, handler, cache_backend, key, policy
+    )
 
-    # Not cached
-    return await handler(request)
+    return original_response
 
 
-__all__ = ("cache_middleware",)
+__all__ = (
+    "cache_middleware",
+    "resolve_cache_policies",
+    "tee_streamed_response",
+)
@@ -0,0 +1,253 @@
+import json
+import pickle  # nosec
+import struct
+
+from typing import Any, Dict, Mapping, Optional, Type, Union
+
+from multidict import CIMultiDict
+
+from aiohttp_cache.exceptions import HTTPCache
+
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class Serializer:
+    """Serialize the cache entries into bytes."""
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, data: bytes) -> Any:
+        """Deserialize the entry, None if it can't be deserialized."""
+        raise NotImplementedError()
+
+
+# --------------------------------------------------------------------------
+# BINARY SERIALIZER
+# --------------------------------------------------------------------------
+#
+# Cached responses are framed as:
+#
+#   magic (1) | flags (1) | status (2) | headers size (4) | extra size (4)
+#   headers block: "Name: value\r\n" lines
+#   extra block: JSON object with the other keys of the entry, if any
+#   body: the raw body, up to the end
+#
+# Any other value is stored as JSON, and bytes as they are.
+#
+_RESPONSE_FRAME = struct.Struct(">cBHII")
+_RESPONSE = b"R"
+_JSON = b"J"
+_BYTES = b"B"
+
+# Flags of the response frame
+_NO_BODY = 0x01
+
+_RESPONSE_KEYS = ("status", "headers", "body")
+
+
+def _is_response(value: Any) -> bool:
+    return (
+        isinstance(value, dict)
+        and isinstance(value.get("status"), int)
+        and isinstance(value.get("headers"), Mapping)
+        and (
+            value.get("body") is None
+            or isinstance(value["body"], (bytes, bytearray, memoryview))
+        )
+    )
+
+
+def dump_headers(headers: Mapping[str, str]) -> bytes:
+    """Render the headers as "Name: value\\r\\n" lines."""
+    return "".join(
+        f"{name}: {value}\r\n" for name, value in headers.items()
+    ).encode("utf-8")
+
+
+def load_headers(block: Union[bytes, memoryview]) -> "CIMultiDict[str]":
+    """Parse the headers rendered by `dump_headers`.
+
+    They are loaded as a `CIMultiDict`, copied by aiohttp without checking
+    them again.
+    """
+    headers: "CIMultiDict[str]" = CIMultiDict()
+    for line in bytes(block).decode("utf-8").split("\r\n"):
+        if line:
+            name, _, value = line.partition(": ")
+            headers.add(name, value)
+    return headers
+
+
+def body_offset(data: Union[bytes, memoryview]) -> Optional[int]:
+    """Return the offset of the body in a serialized response.
+
+    `data` needs to hold at least the fixed size header of the frame.
+    Returns None if it is not a serialized response.
+    """
+    if len(data) < _RESPONSE_FRAME.size or data[:1] != _RESPONSE:
+        return None
+
+    _, _, _, headers_size, extra_size = _RESPONSE_FRAME.unpack_from(data)
+    return _RESPONSE_FRAME.size + headers_size + extra_size
+
+
+class BinarySerializer(Serializer):
+    """Compact binary framing built for the cached responses.
+
+    The body is appended raw to the frame and loaded as a memoryview of
+    the serialized data, without copying it.
+    """
+
+    def dumps(self, value: Any) -> bytes:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return _BYTES + bytes(value)
+
+        if not _is_response(value):
+            return _JSON + json.dumps(value).encode("utf-8")
+
+        headers = dump_headers(value["headers"])
+        extra = {k: v for k, v in value.items() if k not in _RESPONSE_KEYS}
+        extra_block = json.dumps(extra).encode("utf-8") if extra else b""
+        body = value["body"]
+
+        return b"".join(
+            (
+                _RESPONSE_FRAME.pack(
+                    _RESPONSE,
+                    _NO_BODY if body is None else 0,
+                    value["status"],
+                    len(headers),
+                    len(extra_block),
+                ),
+                headers,
+                extra_block,
+                body or b"",
+            )
+        )
+
+    def loads(self, data: bytes) -> Any:
+        magic = data[:1]
+        try:
+            if magic == _RESPONSE:
+                return self._load_response(memoryview(data))
+            if magic == _JSON:
+                return json.loads(bytes(data[1:]))
+        except (ValueError, struct.error):
+            return None
+
+        if magic == _BYTES:
+            return memoryview(data)[1:]
+        return None
+
+    @staticmethod
+    def _load_response(data: memoryview) -> Dict[str, Any]:
+        (
+            _,
+            flags,
+            status,
+            headers_size,
+            extra_size,
+        ) = _RESPONSE_FRAME.unpack_from(data)
+        offset = _RESPONSE_FRAME.size
+
+        headers = load_headers(data[offset : offset + headers_size])
+        offset += headers_size
+
+        value: Dict[str, Any] = {}
+        if extra_size:
+            extra = bytes(data[offset : offset + extra_size])
+            value.update(json.loads(extra))
+        offset += extra_size
+
+        value["status"] = status
+        value["headers"] = headers
+        value["body"] = None if flags & _NO_BODY else data[offset:]
+        return value
+
+
+# --------------------------------------------------------------------------
+# PICKLE SERIALIZER
+# --------------------------------------------------------------------------
+class PickleSerializer(Serializer):
+    """Pickle serializer, the format used by previous versions.
+
+    Only use it with trusted backends, unpickling is not safe.
+    """
+
+    def dumps(self, value: Any) -> bytes:
+        t = type(value)
+        if t in (int,):
+            return str(value).encode("ascii")
+        return b"!" + pickle.dumps(value)
+
+    def loads(self, data: bytes) -> Any:
+        if data.startswith(b"!"):
+            try:
+                return pickle.loads(data[1:])  # nosec
+            except pickle.PickleError:
+                return None
+        try:
+            return int(data)
+        except ValueError:
+            # before 0.8 we did not have serialization.  Still support that.
+            return data
+
+
+# --------------------------------------------------------------------------
+# MSGPACK SERIALIZER
+# --------------------------------------------------------------------------
+class MsgpackSerializer(Serializer):
+    """Msgpack serializer, requires the `msgpack` package."""
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise HTTPCache("msgpack serializer requires msgpack installed")
+
+    def dumps(self, value: Any) -> bytes:
+        if isinstance(value, dict) and isinstance(
+            value.get("body"), memoryview
+        ):
+            value = dict(value, body=bytes(value["body"]))
+        return msgpack.packb(value, use_bin_type=True)  # type: ignore
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except ValueError:
+            return None
+
+
+SERIALIZERS: Dict[str, Type[Serializer]] = {
+    "binary": BinarySerializer,
+    "pickle": PickleSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+def get_serializer(serializer: Union[str, Serializer]) -> Serializer:
+    """Return the serializer, looking it up by name if needed."""
+    if isinstance(serializer, Serializer):
+        return serializer
+
+    try:
+        return SERIALIZERS[serializer.lower()]()
+    except KeyError:
+        raise HTTPCache(
+            f"Invalid serializer selected: '{serializer}'. "
+            f"Available: {', '.join(SERIALIZERS)}"
+        ) from None
+
+
+__all__ = (
+    "BinarySerializer",
+    "MsgpackSerializer",
+    "PickleSerializer",
+    "SERIALIZERS",
+    "Serializer",
+    "get_serializer",
+)
@@ -6,42 +6,106 @@ from aiohttp import web
 
 from aiohttp_cache import (
     AvailableKeys,
+    DiskCache,
+    DiskConfig,
     MemoryCache,
+    MemoryConfig,
     RedisCache,
     RedisConfig,
+    SharedMemoryCache,
+    SharedMemoryConfig,
+    TieredCache,
+    TieredConfig,
     cache_middleware,
 )
-from aiohttp_cache.backends import DEFAULT_KEY_PATTERN
+from aiohttp_cache.backends import DEFAULT_KEY_PATTERN, KeyHasher
 from aiohttp_cache.exceptions import HTTPCache
+from aiohttp_cache.metrics import CacheMetrics, metrics_handler
+from aiohttp_cache.middleware import (
+    resolve_cache_policies,
+    tee_streamed_response,
+)
 
 
 log = logging.getLogger("aiohttp")
 
 
+async def _start_backend(app: web.Application) -> None:
+    await app["cache"].start()
+
+
+async def _close_backend(app: web.Application) -> None:
+    await app["cache"].close()
+
+
+async def _dump_snapshot(app: web.Application) -> None:
+    try:
+        count = await app["cache"].dump()
+    except Exception:
+        log.exception("Error dumping the cache snapshot")
+    else:
+        log.debug("Dumped %d entries to the cache snapshot", count)
+
+
 def setup_cache(
     app: web.Application,
     cache_type: str = "memory",
     key_pattern: Tuple[AvailableKeys, ...] = DEFAULT_KEY_PATTERN,
     encrypt_key: bool = True,
-    backend_config: Optional[RedisConfig] = None,
+    key_hasher: Union[str, KeyHasher] = "sha256",
+    backend_config: Optional[
+        Union[
+            MemoryConfig,
+            RedisConfig,
+            TieredConfig,
+            DiskConfig,
+            SharedMemoryConfig,
+        ]
+    ] = None,
+    metrics: bool = False,
+    metrics_path: Optional[str] = None,
 ) -> None:
     """Setup a cache for the application.
 
     Check examples of a setup at
     <https://github.com/cr0hn/aiohttp-cache#how-to-use-it>
 
-    :param cache_type: could be "memory" or "redis"
+    :param cache_type: could be "memory", "redis", "tiered", "disk" or
+        "shared_memory"
     :param key_pattern: what to consider as identical request
     :param encrypt_key: encrypt the key in the caching backend
+    :param key_hasher: how to encrypt the key, could be "sha256",
+        "blake2b", "xxhash" (if installed) or a `KeyHasher`
     :param backend_config: set a backend config
+    :param metrics: collect the metrics of the cache in
+        `app["cache"].metrics`
+    :param metrics_path: serve the metrics in the Prometheus text format
+        at this path, implies `metrics`
     """
     app.middlewares.append(cache_middleware)
+    app.on_response_prepare.append(tee_streamed_response)
 
-    _cache_backend: Optional[Union[MemoryCache, RedisCache]] = None
+    _cache_backend: Optional[
+        Union[
+            MemoryCache, RedisCache, TieredCache, DiskCache, SharedMemoryCache
+        ]
+    ] = None
     if cache_type.lower() == "memory":
+        _memory_config = backend_config or MemoryConfig()
+
+        if not isinstance(_memory_config, MemoryConfig):
+            raise AssertionError(
+                f"Config must be a MemoryConfig object. Got: "
+                f"'{type(_memory_config)}'"
+            )
         _cache_backend = MemoryCache(
-            key_pattern=key_pattern, encrypt_key=encrypt_key
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+            config=_memory_config,
         )
+        if _memory_config.snapshot_path is not None:
+            app.on_shutdown.append(_dump_snapshot)
 
         log.debug("Selected cache: {}".format(cache_type.upper()))
 
@@ -57,13 +121,75 @@ def setup_cache(
             config=_redis_config,
             key_pattern=key_pattern,
             encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        log.debug("Selected cache: {}".format(cache_type.upper()))
+
+    elif cache_type.lower() == "tiered":
+        _tiered_config = backend_config or TieredConfig()
+
+        if not isinstance(_tiered_config, TieredConfig):
+            raise AssertionError(
+                f"Config must be a TieredConfig object. Got: "
+                f"'{type(_tiered_config)}'"
+            )
+        _cache_backend = TieredCache(
+            config=_tiered_config,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        log.debug("Selected cache: {}".format(cache_type.upper()))
+
+    elif cache_type.lower() == "disk":
+        # No default path, the cache files must not be shared by accident
+        _disk_config = backend_config
+
+        if not isinstance(_disk_config, DiskConfig):
+            raise AssertionError(
+                f"Config must be a DiskConfig object. Got: "
+                f"'{type(_disk_config)}'"
+            )
+        _cache_backend = DiskCache(
+            config=_disk_config,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
+        )
+
+        log.debug("Selected cache: {}".format(cache_type.upper()))
+
+    elif cache_type.lower() == "shared_memory":
+        _shared_memory_config = backend_config or SharedMemoryConfig()
+
+        if not isinstance(_shared_memory_config, SharedMemoryConfig):
+            raise AssertionError(
+                f"Config must be a SharedMemoryConfig object. Got: "
+                f"'{type(_shared_memory_config)}'"
+            )
+        _cache_backend = SharedMemoryCache(
+            config=_shared_memory_config,
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+            key_hasher=key_hasher,
         )
 
         log.debug("Selected cache: {}".format(cache_type.upper()))
     else:
         raise HTTPCache("Invalid cache type selected")
 
+    if metrics or metrics_path:
+        _cache_backend.metrics = CacheMetrics()
+        if metrics_path:
+            app.router.add_get(metrics_path, metrics_handler)
+
     app["cache"] = _cache_backend
 
+    app.on_startup.append(_start_backend)
+    app.on_startup.append(resolve_cache_policies)
+    app.on_cleanup.append(_close_backend)
+
 
 __all__ = ("setup_cache",)
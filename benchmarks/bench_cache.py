@@ -0,0 +1,299 @@
+"""Benchmark the cache middleware and backends.
+
+An application set up with `setup_cache` is served in-process, and driven
+by concurrent clients. For each backend, it measures the throughput and the
+latency percentiles of:
+
+- `hit`: requests to a cached route, served from the cache.
+- `miss`: requests to a cached route, with a new key each time.
+- `uncached`: requests to a route without `@cache`.
+- `large_body`: hits of a route with a large body.
+- `key`: the build of the key of a request, without HTTP.
+
+The results are printed as JSON, to be compared across versions. Run it
+with the package installed, from the root of the repository:
+
+    python benchmarks/bench_cache.py --output results.json
+    python benchmarks/bench_cache.py --backends redis --fake-redis
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import yarl
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+
+from aiohttp_cache import RedisConfig, cache, setup_cache
+
+
+try:
+    from importlib.metadata import version
+except ImportError:  # pragma: no cover
+    version = None  # type: ignore
+
+
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:  # pragma: no cover
+    TcpFakeServer = None
+
+
+SMALL_BODY = b'{"hello": "aiohttp_cache"}'
+PERCENTILES = (50, 90, 99)
+
+
+# --------------------------------------------------------------------------
+# APPLICATION
+# --------------------------------------------------------------------------
+def build_application(
+    backend: str, redis_url: str, large_body_size: int
+) -> web.Application:
+    large_body = os.urandom(large_body_size)
+
+    @cache(expires=3600)
+    async def cached(request: web.Request) -> web.Response:
+        return web.Response(body=SMALL_BODY, content_type="application/json")
+
+    @cache(expires=3600)
+    async def large(request: web.Request) -> web.Response:
+        return web.Response(body=large_body)
+
+    async def uncached(request: web.Request) -> web.Response:
+        return web.Response(body=SMALL_BODY, content_type="application/json")
+
+    app = web.Application()
+    if backend == "memory":
+        setup_cache(app)
+    elif backend == "redis":
+        url = yarl.URL(redis_url)
+        setup_cache(
+            app,
+            cache_type="redis",
+            backend_config=RedisConfig(
+                db=int(url.path[1:] or 0), host=url.host, port=url.port
+            ),
+        )
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    app.router.add_get("/cached", cached)
+    app.router.add_get("/large", large)
+    app.router.add_get("/uncached", uncached)
+    return app
+
+
+# --------------------------------------------------------------------------
+# MEASURES
+# --------------------------------------------------------------------------
+def _percentile(latencies: List[float], percentile: int) -> float:
+    index = round(percentile / 100 * (len(latencies) - 1))
+    return latencies[index]
+
+
+def _summarize(
+    backend: str, scenario: str, latencies: List[float], elapsed: float
+) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    summary = {
+        "backend": backend,
+        "scenario": scenario,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 6),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "latency_us": {
+            f"p{percentile}": round(_percentile(latencies, percentile) * 1e6)
+            for percentile in PERCENTILES
+        },
+    }
+    summary["latency_us"]["mean"] = round(statistics.mean(latencies) * 1e6)
+    summary["latency_us"]["max"] = round(latencies[-1] * 1e6)
+    return summary
+
+
+async def _run(
+    call: Callable[[int], Awaitable[None]],
+    requests: int,
+    concurrency: int,
+) -> Tuple[List[float], float]:
+    """Run `requests` calls in `concurrency` workers, timing each one."""
+    latencies: List[float] = []
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for n in counter:
+            start = time.perf_counter()
+            await call(n)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def _get(client: TestClient, path: str) -> None:
+    async with client.get(path) as response:
+        await response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path} returned {response.status}")
+
+
+async def bench_backend(
+    backend: str, args: argparse.Namespace
+) -> List[Dict[str, Any]]:
+    app = build_application(backend, args.redis_url, args.large_body_size)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    client = TestClient(TestServer(app), connector=connector)
+    await client.start_server()
+    try:
+        await app["cache"].clear()
+
+        scenarios: Dict[str, Callable[[int], Awaitable[None]]] = {
+            "hit": lambda n: _get(client, "/cached"),
+            "miss": lambda n: _get(client, f"/cached?n={n}"),
+            "uncached": lambda n: _get(client, "/uncached"),
+            "large_body": lambda n: _get(client, "/large"),
+        }
+        request = make_mocked_request(
+            "GET", "/cached?q=1", headers={"Host": "localhost"}, app=app
+        )
+
+        async def build_key(n: int) -> None:
+            await app["cache"].make_key(request)
+
+        results = []
+        for scenario, call in scenarios.items():
+            # Warm up, filling the cache of the hit scenarios
+            await _run(call, args.warmup, args.concurrency)
+            if scenario == "miss":
+                await app["cache"].clear()
+            latencies, elapsed = await _run(
+                call, args.requests, args.concurrency
+            )
+            results.append(_summarize(backend, scenario, latencies, elapsed))
+
+        latencies, elapsed = await _run(build_key, args.requests, 1)
+        results.append(_summarize(backend, "key", latencies, elapsed))
+
+        await app["cache"].clear()
+    finally:
+        await client.close()
+    return results
+
+
+# --------------------------------------------------------------------------
+# REDIS
+# --------------------------------------------------------------------------
+def start_fake_redis() -> str:
+    """Serve a fake redis in a thread, returning its url."""
+    if TcpFakeServer is None:
+        raise SystemExit("--fake-redis requires the fakeredis package")
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def _version(package: str) -> Optional[str]:
+    if version is None:
+        return None
+    try:
+        return version(package)
+    except Exception:
+        return None
+
+
+# --------------------------------------------------------------------------
+# MAIN
+# --------------------------------------------------------------------------
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--backends",
+        default="memory,redis",
+        help="comma separated backends: memory, redis (default: %(default)s)",
+    )
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--large-body-size",
+        type=int,
+        default=1024 * 1024,
+        help="bytes of the body of the large_body scenario",
+    )
+    parser.add_argument(
+        "--redis-url",
+        default=os.environ.get("CACHE_URL", "redis://localhost:6379/0"),
+        help="redis of the redis backend (default: $CACHE_URL or "
+        "%(default)s)",
+    )
+    parser.add_argument(
+        "--fake-redis",
+        action="store_true",
+        help="run the redis backend against fakeredis instead",
+    )
+    parser.add_argument(
+        "--output", help="write the JSON results to a file, not to stdout"
+    )
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "redis" in backends and args.fake_redis:
+        args.redis_url = start_fake_redis()
+
+    results = []
+    for backend in backends:
+        results += await bench_backend(backend, args)
+
+    return {
+        "aiohttp_cache": _version("aiohttp-cache"),
+        "aiohttp": aiohttp.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "large_body_size": args.large_body_size,
+            "redis": "fake" if args.fake_redis else "server",
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+
+    for result in report["results"]:
+        latency = result["latency_us"]
+        print(
+            f"{result['backend']:>8} {result['scenario']:>10} "
+            f"{result['throughput']:>10.1f} req/s  "
+            f"p50 {latency['p50']:>6}us  p99 {latency['p99']:>6}us",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -1,4 +1,7 @@
 import asyncio
+import shutil
+import tempfile
+import uuid
 
 import pytest
 import yarl
@@ -7,7 +10,13 @@ from aiohttp import web
 from aiohttp.test_utils import TestClient
 from envparse import env
 
-from aiohttp_cache import RedisConfig, cache, setup_cache
+from aiohttp_cache import (
+    DiskConfig,
+    RedisConfig,
+    SharedMemoryConfig,
+    cache,
+    setup_cache,
+)
 from aiohttp_cache.backends import DEFAULT_KEY_PATTERN, AvailableKeys
 
 
@@ -26,6 +35,7 @@ def build_application(
     cache_type="memory",
     key_pattern=DEFAULT_KEY_PATTERN,
     encrypt_key=True,
+    **backend_options,
 ) -> web.Application:
     app = web.Application()
     if cache_type == "memory":
@@ -39,7 +49,10 @@ def build_application(
             env.str("CACHE_URL", default="redis://localhost:6379/0")
         )
         redis_config = RedisConfig(
-            db=int(url.path[1:]), host=url.host, port=url.port
+            db=int(url.path[1:]),
+            host=url.host,
+            port=url.port,
+            **backend_options,
         )
         setup_cache(
             app,
@@ -48,8 +61,39 @@ def build_application(
             key_pattern=key_pattern,
             encrypt_key=encrypt_key,
         )
+    elif cache_type == "disk":
+        path = tempfile.mkdtemp()
+        setup_cache(
+            app,
+            cache_type=cache_type,
+            backend_config=DiskConfig(path=path, **backend_options),
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+        )
+
+        async def remove_cache_dir(app: web.Application) -> None:
+            shutil.rmtree(path)
+
+        app.on_cleanup.append(remove_cache_dir)
+    elif cache_type == "shared_memory":
+        setup_cache(
+            app,
+            cache_type=cache_type,
+            backend_config=SharedMemoryConfig(
+                name=f"aiohttp-cache-{uuid.uuid4().hex}", **backend_options
+            ),
+            key_pattern=key_pattern,
+            encrypt_key=encrypt_key,
+        )
+
+        async def unlink_cache(app: web.Application) -> None:
+            app["cache"].unlink()
+
+        app.on_cleanup.append(unlink_cache)
     else:
-        raise ValueError("cache_type should be `memory` or `redis`")
+        raise ValueError(
+            "cache_type should be `memory`, `redis`, `disk` or `shared_memory`"
+        )
     app.router.add_post("/", some_long_running_view)
     return app
 
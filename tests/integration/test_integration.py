@@ -1,15 +1,37 @@
+import asyncio
 import functools
+import io
 import logging
 import sys
 import time
 
 from collections.abc import Callable
 from typing import Counter, Dict
+from unittest import mock
+
+import aiohttp
+import pytest
+import yarl
 
 from aiohttp import web
+from envparse import env
 
-from aiohttp_cache import cache, setup_cache
-from tests.conftest import PAYLOAD
+from aiohttp_cache import (
+    AvailableKeys,
+    MemoryConfig,
+    RedisCache,
+    RedisConfig,
+    TieredCache,
+    TieredConfig,
+    backends,
+    cache,
+    middleware,
+    setup_cache,
+)
+from aiohttp_cache.circuit_breaker import CircuitBreaker
+from aiohttp_cache.compression import Compressor
+from aiohttp_cache.exceptions import BackendUnavailable
+from tests.conftest import PAYLOAD, build_application
 
 
 logger = logging.getLogger(__name__)
@@ -112,3 +134,995 @@ async def test_various_handlers_type(aiohttp_client, caplog):
     #   handler added via fucntools.partial)
     if sys.version_info >= (3, 9):
         assert loggers_entries_counter["Calling b handler"] == 1
+
+
+async def test_policy_resolved_once_per_route(aiohttp_client):
+    @cache()
+    async def cached(request: web.Request) -> web.Response:
+        return web.Response(text="cached")
+
+    async def uncached(request: web.Request) -> web.Response:
+        return web.Response(text="uncached")
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/cached", cached)
+    app.router.add_get("/uncached", uncached)
+    client = await aiohttp_client(app)
+
+    # resolved on startup, no introspection of the handlers per request
+    with mock.patch.object(
+        middleware, "get_original_handler", side_effect=AssertionError
+    ):
+        for _ in range(2):
+            assert await (await client.get("/cached")).text() == "cached"
+            assert await (await client.get("/uncached")).text() == "uncached"
+            # unmatched routes share a policy
+            assert (await client.get("/missing")).status == 404
+            assert (await client.post("/cached")).status == 405
+
+
+async def test_per_route_keys(aiohttp_client):
+    calls = Counter()
+
+    @cache(sort_query=True, query_deny=["utm_*"])
+    async def normalized(request: web.Request) -> web.Response:
+        calls["normalized"] += 1
+        return web.Response(text="normalized")
+
+    @cache(key=lambda request: f"item:{request.match_info['id']}")
+    async def item(request: web.Request) -> web.Response:
+        calls["item"] += 1
+        return web.Response(text=request.match_info["id"])
+
+    @cache(key_pattern=(AvailableKeys.method,))
+    async def by_method(request: web.Request) -> web.Response:
+        calls["by_method"] += 1
+        return web.Response(text="by_method")
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/normalized", normalized)
+    app.router.add_get("/items/{id}", item)
+    app.router.add_get("/by_method", by_method)
+    client = await aiohttp_client(app)
+
+    for path in (
+        "/normalized?a=1&b=2",
+        "/normalized?b=2&a=1",
+        "/normalized?a=1&b=2&utm_source=mail",
+    ):
+        assert await (await client.get(path)).text() == "normalized"
+    await client.get("/normalized?a=2&b=2")
+    for path in ("/items/1", "/items/1?page=2", "/items/2"):
+        await client.get(path)
+    await client.get("/by_method?a=1")
+    await client.get("/by_method?a=2")
+
+    assert calls == {"normalized": 2, "item": 2, "by_method": 1}
+    assert await client.app["cache"].has("item:1")
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "redis"])
+async def test_cacheability_filters(aiohttp_client, monkeypatch, cache_type):
+    calls = Counter()
+
+    @cache(cacheable_statuses=(200, 404), negative_expires=10)
+    async def lookup(request: web.Request) -> web.Response:
+        calls[request.path] += 1
+        status = int(request.match_info["status"])
+        return web.Response(status=status, text="lookup")
+
+    @cache(max_body_size=10)
+    async def sized(request: web.Request) -> web.Response:
+        calls[request.path] += 1
+        return web.Response(text=request.match_info["body"])
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/lookup/{status}", lookup)
+    app.router.add_get("/sized/{body}", sized)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    for _ in range(2):
+        for path in ("/lookup/200", "/lookup/404", "/lookup/500"):
+            await client.get(path)
+        await client.get("/sized/small")
+        await client.get("/sized/too-big-to-cache")
+    assert calls == {
+        "/lookup/200": 1,
+        "/lookup/404": 1,
+        "/lookup/500": 2,
+        "/sized/small": 1,
+        "/sized/too-big-to-cache": 2,
+    }
+
+    # the 404 expires first
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 20)
+    await client.get("/lookup/200")
+    await client.get("/lookup/404")
+    if cache_type == "memory":
+        assert calls["/lookup/404"] == 2
+    assert calls["/lookup/200"] == 1
+
+
+async def test_backend_cacheability_filters(aiohttp_client):
+    calls = 0
+
+    @cache()
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(status=503, text="unavailable")
+
+    app = web.Application()
+    setup_cache(app, backend_config=MemoryConfig(cacheable_statuses={200}))
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    for _ in range(2):
+        assert (await client.get("/")).status == 503
+    assert calls == 2
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "redis", "disk"])
+async def test_range_requests(aiohttp_client, cache_type):
+    calls = 0
+
+    @cache(conditional=True)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(body=b"0123456789")
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    with mock.patch.object(RedisCache, "get", side_effect=AssertionError):
+        # a miss, the entry isn't read twice
+        response = await client.get("/", headers={"Range": "bytes=2-5"})
+        assert response.status == 200
+        etag = response.headers["ETag"]
+
+        for header, content_range, body in (
+            ("bytes=2-5", "bytes 2-5/10", b"2345"),
+            ("bytes=7-", "bytes 7-9/10", b"789"),
+            ("bytes=-3", "bytes 7-9/10", b"789"),
+            ("bytes=8-100", "bytes 8-9/10", b"89"),
+        ):
+            response = await client.get(
+                "/", headers={"Range": header, "If-Range": etag}
+            )
+            assert response.status == 206
+            assert response.headers["Content-Range"] == content_range
+            assert await response.read() == body
+
+        response = await client.get("/", headers={"Range": "bytes=10-"})
+        assert response.status == 416
+        assert response.headers["Content-Range"] == "bytes */10"
+
+    for headers in (
+        {"Range": "bytes=2-5", "If-Range": '"outdated"'},
+        {"Range": "bytes=0-1,4-5"},
+        {"Range": "lines=1-2"},
+    ):
+        response = await client.get("/", headers=headers)
+        assert response.status == 200
+        assert await response.read() == b"0123456789"
+    assert calls == 1
+
+
+async def test_single_flight(aiohttp_client):
+    calls = 0
+
+    @cache(single_flight=True)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return web.Response(text="hello")
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    responses = await asyncio.gather(*(client.get("/") for _ in range(5)))
+    assert [r.status for r in responses] == [200] * 5
+    assert [await r.text() for r in responses] == ["hello"] * 5
+    assert calls == 1
+
+
+async def test_single_flight_across_processes(aiohttp_client):
+    calls = 0
+
+    @cache(single_flight=True)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.2)
+        return web.Response(text="hello")
+
+    clients = []
+    for _ in range(2):
+        app = build_application(cache_type="redis", lock_timeout=1)
+        app.router.add_get("/single-flight", handler)
+        clients.append(await aiohttp_client(app))
+    await clients[0].app["cache"].clear()
+
+    responses = await asyncio.gather(
+        *(client.get("/single-flight") for client in clients * 2)
+    )
+    assert [await r.text() for r in responses] == ["hello"] * 4
+    assert calls == 1
+
+
+async def test_stale_while_revalidate(aiohttp_client, monkeypatch):
+    calls = 0
+
+    @cache(expires=1, stale_while_revalidate=10)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(text=str(calls))
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    assert await (await client.get("/")).text() == "1"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    # stale response, refreshed in background
+    assert await (await client.get("/")).text() == "1"
+    await asyncio.sleep(0.05)
+    assert await (await client.get("/")).text() == "2"
+    assert calls == 2
+
+
+async def test_stale_while_revalidate_copies_request(
+    aiohttp_client, monkeypatch
+):
+    requests = []
+
+    @cache(expires=1, stale_while_revalidate=10)
+    async def handler(request: web.Request) -> web.Response:
+        requests.append(request)
+        return web.Response(text=str(len(requests)))
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    app.router.add_post("/", handler)
+    client = await aiohttp_client(app)
+
+    assert await (await client.get("/")).text() == "1"
+    assert await (await client.post("/", data=b"body")).text() == "2"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    # the background refresh runs on a copy of the request
+    assert await (await client.get("/")).text() == "1"
+    await asyncio.sleep(0.05)
+    assert len(requests) == 3
+    assert requests[2].path == "/"
+    # a request with a body is regenerated before answering
+    assert await (await client.post("/", data=b"body")).text() == "4"
+
+
+async def test_stale_if_error(aiohttp_client, monkeypatch):
+    calls = 0
+
+    @cache(expires=1, stale_if_error=10)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise RuntimeError("upstream is down")
+        return web.Response(text="hello")
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    assert await (await client.get("/")).text() == "hello"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    resp = await client.get("/")
+    assert resp.status == 200
+    assert await resp.text() == "hello"
+
+    # out of the stale window
+    monkeypatch.setattr(time, "time", lambda: now + 20)
+    assert (await client.get("/")).status == 500
+
+
+async def test_compression(aiohttp_client):
+    text = "hello aiohttp_cache " * 100
+
+    @cache(compression="gzip")
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text=text)
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert await resp.text() == text
+
+    # hit, served compressed as stored
+    resp = await client.get("/", headers={"Accept-Encoding": "gzip, br"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert await resp.text() == text
+
+    # hit, decompressed for clients not accepting gzip
+    resp = await client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in resp.headers
+    assert await resp.text() == text
+
+    [(value, _)] = client.app["cache"]._cache.values()
+    assert value["content_encoding"] == "gzip"
+    assert len(value["body"]) < len(text)
+
+
+async def test_compression_payload_body(aiohttp_client):
+    @cache(compression="gzip")
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(body=io.BytesIO(b"payload " * 1000))
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    # the body is a payload, it isn't compressed
+    resp = await client.get("/")
+    assert resp.status == 200
+    assert await resp.read() == b"payload " * 1000
+
+
+async def test_custom_compression(aiohttp_client):
+    class ReverseCompressor(Compressor):
+        encoding = "x-reverse"
+
+        def compress(self, data: bytes) -> bytes:
+            return data[::-1]
+
+        def decompress(self, data: bytes) -> bytes:
+            return data[::-1]
+
+    calls = 0
+
+    @cache(compression=ReverseCompressor())
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(text="hello")
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    assert await (await client.get("/")).text() == "hello"
+    # hit, decompressed by the compressor of the route
+    assert await (await client.get("/")).text() == "hello"
+    assert calls == 1
+
+    # an encoding without compressor falls back to the handler
+    [(value, _)] = client.app["cache"]._cache.values()
+    value["content_encoding"] = "x-unknown"
+    assert await (await client.get("/")).text() == "hello"
+    assert calls == 2
+
+
+@pytest.mark.parametrize(
+    "cache_type", ["memory", "redis", "disk", "shared_memory"]
+)
+async def test_conditional_requests(aiohttp_client, cache_type):
+    calls = 0
+
+    @cache(conditional=True, compression="gzip")
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(text="hello aiohttp_cache " * 100)
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    resp = await client.get("/", headers={"Accept-Encoding": "identity"})
+    etag = resp.headers["ETag"]
+    last_modified = resp.headers["Last-Modified"]
+
+    resp = await client.get("/", headers={"If-None-Match": etag})
+    assert resp.status == 304
+    assert await resp.read() == b""
+    assert resp.headers["ETag"] == etag[:-1] + '-gzip"'
+
+    # the ETag of the compressed representation is valid too
+    resp = await client.get(
+        "/",
+        headers={"If-None-Match": f'"other", W/{etag[:-1]}-gzip"'},
+    )
+    assert resp.status == 304
+
+    resp = await client.get("/", headers={"If-Modified-Since": last_modified})
+    assert resp.status == 304
+    assert resp.headers["Last-Modified"] == last_modified
+
+    resp = await client.get("/", headers={"If-None-Match": '"other"'})
+    assert resp.status == 200
+    assert resp.headers["ETag"] == etag[:-1] + '-gzip"'
+    assert calls == 1
+
+    # the validators are not used once the entry is gone
+    async def has(key: str) -> bool:
+        return False
+
+    with mock.patch.object(client.app["cache"], "has", has):
+        resp = await client.get("/", headers={"If-None-Match": etag})
+    assert resp.status == 200
+
+
+async def test_conditional_requests_lowercase_validators(aiohttp_client):
+    calls = 0
+
+    @cache(conditional=True)
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(
+            text="hello",
+            headers={
+                "etag": '"lowercase"',
+                "last-modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+            },
+        )
+
+    app = build_application(cache_type="memory")
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    await client.get("/")
+    resp = await client.get("/", headers={"If-None-Match": '"lowercase"'})
+    assert resp.status == 304
+    resp = await client.get(
+        "/", headers={"If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    )
+    assert resp.status == 304
+    assert calls == 1
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "redis", "disk"])
+async def test_http_semantics(aiohttp_client, cache_type, monkeypatch):
+    calls = Counter()
+
+    @cache(http_semantics=True)
+    async def greeting(request: web.Request) -> web.Response:
+        language = request.headers.get("Accept-Language", "en")
+        calls[language] += 1
+        return web.Response(
+            text=f"hello {language}", headers={"Vary": "Accept-Language"}
+        )
+
+    @cache(http_semantics=True)
+    async def private(request: web.Request) -> web.Response:
+        calls["private"] += 1
+        return web.Response(headers={"Cache-Control": "private, max-age=60"})
+
+    @cache(http_semantics=True, expires=3600)
+    async def max_age(request: web.Request) -> web.Response:
+        return web.Response(
+            headers={"Cache-Control": "max-age=60, s-maxage=10"}
+        )
+
+    @cache(http_semantics=True)
+    async def max_age_zero(request: web.Request) -> web.Response:
+        calls["max_age_zero"] += 1
+        return web.Response(headers={"Cache-Control": "max-age=0"})
+
+    @cache(http_semantics=True, expires=0)
+    async def forever(request: web.Request) -> web.Response:
+        calls["forever"] += 1
+        return web.Response()
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/greeting", greeting)
+    app.router.add_get("/private", private)
+    app.router.add_get("/max_age", max_age)
+    app.router.add_get("/max_age_zero", max_age_zero)
+    app.router.add_get("/forever", forever)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    for _ in range(2):
+        for language in ("en", "es"):
+            resp = await client.get(
+                "/greeting", headers={"Accept-Language": language}
+            )
+            assert await resp.text() == f"hello {language}"
+        await client.get("/private")
+        await client.get("/max_age_zero")
+        await client.get("/forever")
+    assert calls == {
+        "en": 1,
+        "es": 1,
+        "private": 2,
+        "max_age_zero": 2,
+        "forever": 1,
+    }
+
+    # an expiration of 0 caches without expiration
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 365 * 24 * 3600)
+    await client.get("/forever")
+    assert calls["forever"] == 1
+    monkeypatch.undo()
+
+    with mock.patch.object(
+        client.app["cache"], "set", wraps=client.app["cache"].set
+    ) as set_:
+        await client.get("/max_age")
+    # s-maxage takes precedence over max-age
+    assert set_.call_args[0][2] == 10
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "redis", "disk"])
+async def test_streamed_response(aiohttp_client, cache_type, monkeypatch):
+    monkeypatch.setattr(middleware, "STREAM_CHUNK_SIZE", 4096)
+    calls = Counter()
+    chunk = b"0123456789abcdef" * 1000
+
+    async def stream(request: web.Request) -> web.StreamResponse:
+        calls[request.path] += 1
+        response = web.StreamResponse(headers={"X-Stream": "yes"})
+        await response.prepare(request)
+        for _ in range(3):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = build_application(cache_type=cache_type)
+
+    @cache()
+    async def cached_stream(request: web.Request) -> web.StreamResponse:
+        return await stream(request)
+
+    @cache(stream_max_size=len(chunk))
+    async def big_stream(request: web.Request) -> web.StreamResponse:
+        return await stream(request)
+
+    app.router.add_get("/stream", cached_stream)
+    app.router.add_get("/big", big_stream)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    for _ in range(2):
+        for path in ("/stream", "/big"):
+            resp = await client.get(path)
+            assert resp.headers["X-Stream"] == "yes"
+            assert await resp.read() == chunk * 3
+    assert calls == {"/stream": 1, "/big": 2}
+
+
+@pytest.mark.parametrize("cache_type", ["memory", "shared_memory"])
+async def test_streamed_response_missing_chunks(aiohttp_client, cache_type):
+    calls = 0
+    chunk = b"0123456789abcdef" * 8192
+
+    @cache()
+    async def stream(request: web.Request) -> web.StreamResponse:
+        nonlocal calls
+        calls += 1
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/", stream)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    assert await (await client.get("/")).read() == chunk
+    if cache_type == "memory":
+        # cached, then a chunk is evicted
+        assert await (await client.get("/")).read() == chunk
+        assert calls == 1
+        [key] = [k for k in client.app["cache"]._cache if ":chunk:1" in k]
+        await client.app["cache"].delete(key)
+
+    # generated again, instead of a truncated response
+    assert await (await client.get("/")).read() == chunk
+    assert calls == 2
+
+
+async def test_streamed_response_read_in_windows(aiohttp_client, monkeypatch):
+    monkeypatch.setattr(middleware, "STREAM_CHUNK_SIZE", 1024)
+    calls = 0
+    body = bytes(range(256)) * 80
+
+    @cache()
+    async def stream(request: web.Request) -> web.StreamResponse:
+        nonlocal calls
+        calls += 1
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(body)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    setup_cache(app)
+    app.router.add_get("/", stream)
+    client = await aiohttp_client(app)
+    await client.get("/")
+
+    backend = client.app["cache"]
+    reads = []
+    get_many = backend.get_many
+
+    async def windowed_get_many(keys):
+        reads.append(len(keys))
+        return await get_many(keys)
+
+    monkeypatch.setattr(backend, "get_many", windowed_get_many)
+    assert await (await client.get("/")).read() == body
+    assert calls == 1
+    # at most a window of chunks is held at once
+    assert sum(reads) == 20
+    assert max(reads) <= middleware.STREAM_READ_WINDOW
+
+    # a chunk evicted while streaming aborts the response
+    async def evicting_get_many(keys):
+        if reads:
+            reads.clear()
+            return await get_many(keys)
+        return [None] * len(keys)
+
+    monkeypatch.setattr(backend, "get_many", evicting_get_many)
+    with pytest.raises(aiohttp.ClientError):
+        await (await client.get("/")).read()
+    assert not backend._cache
+    assert await (await client.get("/")).read() == body
+    assert calls == 2
+
+
+async def test_streamed_response_backend_unavailable(
+    aiohttp_client, monkeypatch
+):
+    calls = 0
+
+    @cache()
+    async def stream(request: web.Request) -> web.StreamResponse:
+        nonlocal calls
+        calls += 1
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(b"streamed")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    setup_cache(app, metrics=True)
+    app.router.add_get("/", stream)
+    client = await aiohttp_client(app)
+    await client.get("/")
+
+    async def has_many(keys):
+        raise BackendUnavailable("down")
+
+    monkeypatch.setattr(client.app["cache"], "has_many", has_many)
+    resp = await client.get("/")
+    assert resp.status == 200
+    assert await resp.read() == b"streamed"
+    assert calls == 2
+    assert client.app["cache"].metrics.requests["GET /"]["bypass"] == 1
+
+
+async def test_tiered_cache_invalidation():
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    config = TieredConfig(
+        redis=RedisConfig(db=int(url.path[1:]), host=url.host, port=url.port),
+        invalidation_channel="aiohttp_cache",
+    )
+    worker_a, worker_b = TieredCache(config), TieredCache(config)
+    await worker_a.start()
+    await worker_b.start()
+    # let the listeners subscribe
+    await asyncio.sleep(0.1)
+
+    value = {"status": 200, "headers": {}, "body": b"hello"}
+    await worker_a.set("tiered", value)
+    assert await worker_b.get("tiered") == value
+    assert await worker_b.memory.has("tiered")
+
+    await worker_a.delete("tiered")
+    await asyncio.sleep(0.1)
+    assert not await worker_b.memory.has("tiered")
+    assert await worker_b.get("tiered") is None
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_tiered_cache_memory_expiration():
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    tiered = TieredCache(
+        TieredConfig(
+            redis=RedisConfig(
+                db=int(url.path[1:]), host=url.host, port=url.port
+            ),
+            memory_expiration=60,
+        )
+    )
+    value = {"status": 200, "headers": {}, "body": b"hello"}
+    now = int(time.time())
+
+    # filled from redis, not for longer than the entry lives there
+    await tiered.redis.set("short", value, expires=5)
+    assert await tiered.get("short") == value
+    assert now + 4 <= tiered.memory._cache["short"][1] <= now + 6
+
+    await tiered.redis.set("forever", value, expires=0)
+    assert await tiered.get_many(["forever"]) == [value]
+    assert tiered.memory._cache["forever"][1] >= now + 60
+
+    # about to expire in redis, it isn't kept in memory
+    await tiered.redis.set("expiring", value, expires=5)
+    await tiered.redis._execute(
+        "PEXPIRE", tiered.redis.key_prefix + "expiring", 500
+    )
+    assert await tiered.get("expiring") == value
+    assert not await tiered.memory.has("expiring")
+
+    await tiered.delete_many(["short", "forever", "expiring"])
+    await tiered.close()
+
+
+async def test_redis_batched_operations():
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    redis_cache = RedisCache(
+        RedisConfig(
+            db=int(url.path[1:]),
+            host=url.host,
+            port=url.port,
+            auto_batch=True,
+        )
+    )
+    values = {
+        f"batch{i}": {"status": 200, "headers": {}, "body": b"%d" % i}
+        for i in range(3)
+    }
+    await redis_cache.set_many(values)
+    assert await redis_cache.get_many([*values, "missing"]) == [
+        *values.values(),
+        None,
+    ]
+
+    with mock.patch.object(
+        redis_cache._redis_pool,
+        "execute_command",
+        wraps=redis_cache._redis_pool.execute_command,
+    ) as execute_command:
+        results = await asyncio.gather(*map(redis_cache.get, values))
+    assert results == list(values.values())
+    assert execute_command.call_count == 1
+    assert execute_command.call_args[0][0] == "MGET"
+
+    await redis_cache.delete_many(list(values))
+    assert await redis_cache.get_many(list(values)) == [None] * 3
+
+
+@pytest.mark.parametrize(
+    "cache_type", ["memory", "redis", "disk", "shared_memory"]
+)
+async def test_invalidate_tag(aiohttp_client, cache_type):
+    calls = Counter()
+
+    @cache(tags=["users"])
+    async def users(request: web.Request) -> web.Response:
+        calls["users"] += 1
+        return web.Response(text="users")
+
+    @cache(tags=["groups"])
+    async def groups(request: web.Request) -> web.Response:
+        calls["groups"] += 1
+        return web.Response(text="groups")
+
+    app = build_application(cache_type=cache_type)
+    app.router.add_get("/users", users)
+    app.router.add_get("/groups", groups)
+    client = await aiohttp_client(app)
+    await client.app["cache"].clear()
+
+    for _ in range(2):
+        await client.get("/users")
+        await client.get("/groups")
+    assert calls == {"users": 1, "groups": 1}
+
+    assert len(await client.app["cache"].invalidate_tag("users")) == 1
+    await client.get("/users")
+    await client.get("/groups")
+    assert calls == {"users": 2, "groups": 1}
+
+
+async def test_redis_invalidate_tag_in_batches(monkeypatch):
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    redis_cache = RedisCache(
+        RedisConfig(db=int(url.path[1:]), host=url.host, port=url.port)
+    )
+    await redis_cache.clear()
+    monkeypatch.setattr(backends, "SCAN_BATCH", 2)
+
+    values = {f"key{i}": {"i": i} for i in range(5)}
+    await redis_cache.set_many(values)
+    # an entry with the key of a tag isn't mistaken for it
+    await redis_cache.set("tag:users", {"i": 5})
+    for key in values:
+        await redis_cache.add_tags(key, ["users"])
+
+    assert sorted(await redis_cache.invalidate_tag("users")) == sorted(values)
+    assert await redis_cache.get_many(list(values)) == [None] * 5
+    assert await redis_cache.get("tag:users") == {"i": 5}
+    assert await redis_cache.invalidate_tag("users") == []
+
+
+async def test_redis_clear_with_key_prefix():
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    config = dict(db=int(url.path[1:]), host=url.host, port=url.port)
+    prefixed = RedisCache(RedisConfig(key_prefix="prefix:", **config))
+    other = RedisCache(RedisConfig(key_prefix="other:", **config))
+
+    await prefixed.set_many({f"key{i}": {"i": i} for i in range(2500)})
+    await other.set("key", {"i": 0})
+    await prefixed.clear()
+
+    assert await prefixed.get_many(["key0", "key2499"]) == [None, None]
+    assert await other.get("key") == {"i": 0}
+
+
+async def test_redis_get_range():
+    url = yarl.URL(env.str("CACHE_URL", default="redis://localhost:6379/0"))
+    redis_cache = RedisCache(
+        RedisConfig(
+            db=int(url.path[1:]), host=url.host, port=url.port, key_prefix="r:"
+        )
+    )
+    await redis_cache.set(
+        "key",
+        {"status": 200, "headers": {"X-A": "a" * 20}, "body": b"0123456789"},
+    )
+    await redis_cache.set("json", {"vary": ["Accept"]})
+    await redis_cache.set(
+        "empty", {"status": 204, "headers": {}, "body": None}
+    )
+
+    value, size = await redis_cache.get_range("key", 3, 6)
+    assert (value["status"], value["headers"]["X-A"]) == (200, "a" * 20)
+    assert (value["body"], size) == (b"345", 10)
+    for start, stop in ((-2, None), (-20, 3), (8, 100), (5, -6), (0, 0)):
+        value, _ = await redis_cache.get_range("key", start, stop)
+        assert value["body"] == b"0123456789"[start:stop]
+    # other values are read whole
+    assert await redis_cache.get_range("json", 0, None) == (
+        {"vary": ["Accept"]},
+        None,
+    )
+    value, size = await redis_cache.get_range("empty", 0, None)
+    assert (value["body"], size) == (None, None)
+    assert await redis_cache.get_range("missing", 0, None) is None
+    await redis_cache.delete_many(["key", "json", "empty"])
+
+
+async def test_redis_circuit_breaker(aiohttp_client, unused_tcp_port):
+    calls = 0
+
+    @cache()
+    async def handler(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        return web.Response(text="hello")
+
+    breaker = CircuitBreaker(
+        failure_threshold=2, recovery_timeout=60, timeout=0.2
+    )
+    app = web.Application()
+    setup_cache(
+        app,
+        cache_type="redis",
+        backend_config=RedisConfig(
+            port=unused_tcp_port,
+            socket_connect_timeout=0.1,
+            circuit_breaker=breaker,
+        ),
+        metrics=True,
+    )
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    # redis is down, the cache is skipped
+    for _ in range(3):
+        resp = await client.get("/")
+        assert resp.status == 200
+        assert await resp.text() == "hello"
+    assert calls == 3
+    assert breaker.is_open
+    assert client.app["cache"].metrics.requests["GET /"] == {"bypass": 3}
+
+
+async def test_metrics(aiohttp_client):
+    @cache()
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text="metrics")
+
+    app = web.Application()
+    setup_cache(app, metrics_path="/metrics")
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    for _ in range(3):
+        await client.get("/")
+
+    metrics = client.app["cache"].metrics
+    assert metrics.requests["GET /"] == {"miss": 1, "hit": 2}
+    assert metrics.hit_ratio() == 2 / 3
+    assert metrics.stored_bytes == len(b"metrics")
+
+    response = await client.get("/metrics")
+    assert response.status == 200
+    text = await response.text()
+    assert 'aiohttp_cache_requests_total{route="GET /",result="hit"} 2' in text
+    assert 'aiohttp_cache_handler_seconds_count{route="GET /"} 1' in text
+    assert 'aiohttp_cache_backend_seconds_count{operation="get"} 3' in text
+
+
+async def test_metrics_count_stale_requests_once(aiohttp_client, monkeypatch):
+    calls = 0
+
+    @cache(expires=1, stale_while_revalidate=10)
+    async def revalidated(request: web.Request) -> web.Response:
+        return web.Response(text="revalidated")
+
+    @cache(expires=1, stale_if_error=10)
+    async def failing(request: web.Request) -> web.Response:
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise RuntimeError("upstream is down")
+        return web.Response(text="failing")
+
+    app = web.Application()
+    setup_cache(app, metrics=True)
+    app.router.add_get("/revalidated", revalidated)
+    app.router.add_get("/failing", failing)
+    client = await aiohttp_client(app)
+
+    await client.get("/revalidated")
+    await client.get("/failing")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    await client.get("/revalidated")
+    await client.get("/failing")
+    await asyncio.sleep(0.05)
+
+    metrics = client.app["cache"].metrics
+    assert metrics.requests["GET /revalidated"] == {"miss": 1, "stale": 1}
+    assert metrics.requests["GET /failing"] == {"miss": 1, "stale": 1}
+    # the revalidation in background is observed, not counted
+    assert metrics.handler_latency["GET /revalidated"].count == 2
+    assert metrics.handler_latency["GET /failing"].count == 2
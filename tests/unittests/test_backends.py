@@ -0,0 +1,473 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from hashlib import sha256
+from unittest import mock
+
+import pytest
+
+from aiohttp import StreamReader, web
+from aiohttp.test_utils import make_mocked_request
+from multidict import CIMultiDictProxy
+
+from aiohttp_cache import (
+    AvailableKeys,
+    DiskCache,
+    DiskConfig,
+    MemoryCache,
+    MemoryConfig,
+    SharedMemoryCache,
+    SharedMemoryConfig,
+    backends,
+    setup_cache,
+)
+from aiohttp_cache.backends import DEFAULT_KEY_PATTERN, KeyBuilder
+from aiohttp_cache.circuit_breaker import CircuitBreaker
+from aiohttp_cache.exceptions import BackendUnavailable, HTTPCache
+
+
+def make_response(body: bytes) -> dict:
+    return {"status": 200, "headers": {}, "body": body}
+
+
+async def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(config=MemoryConfig(max_entries=2))
+
+    await cache.set("a", make_response(b"a"))
+    await cache.set("b", make_response(b"b"))
+    # touch "a" so "b" becomes the least recently used entry
+    assert await cache.get("a")
+    await cache.set("c", make_response(b"c"))
+
+    assert await cache.has("a")
+    assert not await cache.has("b")
+    assert await cache.has("c")
+
+
+async def test_memory_cache_max_size():
+    cache = MemoryCache(config=MemoryConfig(max_size=10))
+
+    await cache.set("a", make_response(b"x" * 4))
+    await cache.set("b", make_response(b"x" * 4))
+    await cache.set("c", make_response(b"x" * 4))
+    assert not await cache.has("a")
+    assert await cache.has("b")
+    assert await cache.has("c")
+
+    # bigger than the whole cache, it is never stored
+    await cache.set("d", make_response(b"x" * 11))
+    assert not await cache.has("d")
+    assert await cache.has("c")
+
+
+async def test_memory_cache_prepares_responses():
+    cache = MemoryCache()
+
+    await cache.set("a", make_response(memoryview(b"body")))
+    value = await cache.get("a")
+    assert value == make_response(b"body")
+    assert type(value["body"]) is bytes
+    assert isinstance(value["headers"], CIMultiDictProxy)
+
+
+async def test_memory_cache_purges_expired_entries(monkeypatch):
+    cache = MemoryCache()
+    now = time.time()
+
+    await cache.set("short", make_response(b"a"), expires=1)
+    await cache.set("long", make_response(b"b"), expires=100)
+
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    await cache.set("other", make_response(b"c"), expires=100)
+
+    # dropped without being requested again
+    assert "short" not in cache._cache
+    assert "long" in cache._cache
+    assert cache._size == 2
+
+
+async def test_memory_cache_write_purges_bounded_batch(monkeypatch):
+    cache = MemoryCache(config=MemoryConfig(sweep_batch=2))
+    now = time.time()
+
+    for i in range(5):
+        await cache.set(str(i), make_response(b"a"), expires=1)
+
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    await cache.set("other", make_response(b"b"), expires=100)
+    assert len(cache._cache) == 4
+    assert cache.sweep() == 3
+    assert list(cache._cache) == ["other"]
+
+
+async def test_memory_cache_sweep_in_batches(monkeypatch):
+    cache = MemoryCache()
+    now = time.time()
+
+    for i in range(5):
+        await cache.set(str(i), make_response(b"a"), expires=1)
+
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    assert cache.sweep(2) == 2
+    assert len(cache._cache) == 3
+    assert cache.sweep() == 3
+    assert not cache._cache
+
+
+async def test_memory_cache_sweeper_task(aiohttp_client, monkeypatch):
+    app = web.Application()
+    setup_cache(app, backend_config=MemoryConfig(sweep_interval=0.01))
+
+    client = await aiohttp_client(app)
+    backend = client.app["cache"]
+    assert backend._sweeper_task is not None
+
+    now = time.time()
+    await backend.set("key", make_response(b"a"), expires=1)
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    await asyncio.sleep(0.05)
+    assert "key" not in backend._cache
+
+    await client.close()
+    assert backend._sweeper_task is None
+
+
+async def test_memory_cache_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    cache = MemoryCache()
+    await cache.set("a", make_response(b"a"), expires=100)
+    await cache.set("b", {"vary": ["Accept"]}, expires=100)
+    await cache.set("chunk", b"chunk", expires=0)
+    await cache.set("short", make_response(b"s"), expires=1)
+    await cache.add_tags("a", ["users"])
+    expire_date = cache._cache["a"][1]
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    assert await cache.dump(path) == 3
+
+    restored = MemoryCache()
+    await restored.set("b", make_response(b"newer"))
+    assert await restored.load(path) == 2
+
+    assert await restored.get("a") == make_response(b"a")
+    assert restored._cache["a"][1] == expire_date
+    assert await restored.get("chunk") == b"chunk"
+    # without expiration
+    assert restored._cache["chunk"][1] is None
+    assert await restored.get("b") == make_response(b"newer")
+    assert not await restored.has("short")
+    # loaded entries are the least recently used ones
+    assert list(restored._cache) == ["a", "chunk", "b"]
+    assert await restored.invalidate_tag("users") == ["a"]
+
+
+async def test_memory_cache_restores_snapshot_on_startup(
+    aiohttp_client, tmp_path
+):
+    config = MemoryConfig(snapshot_path=str(tmp_path / "snapshot"))
+    app = web.Application()
+    setup_cache(app, backend_config=config)
+    client = await aiohttp_client(app)
+    await client.app["cache"].set("key", make_response(b"a"))
+    await client.close()
+
+    app = web.Application()
+    setup_cache(app, backend_config=config)
+    client = await aiohttp_client(app)
+    backend = client.app["cache"]
+    assert await backend._restore_task == 1
+    assert await backend.get("key") == make_response(b"a")
+    await client.close()
+
+
+async def test_disk_cache_shared_across_instances(tmp_path):
+    config = DiskConfig(path=str(tmp_path))
+    first = DiskCache(config=config)
+    second = DiskCache(config=config)
+
+    await first.set("a", make_response(b"a" * 100))
+    value = await second.get("a")
+    assert value == make_response(b"a" * 100)
+    # the body is read from the mapped segment, not copied
+    assert isinstance(value["body"], memoryview)
+
+    await second.delete("a")
+    assert not await first.has("a")
+
+    await first.set("b", make_response(b"b"))
+    await second.clear()
+    assert await first.get("b") is None
+
+    # entries survive restarts
+    await first.set("c", make_response(b"c"))
+    await first.close()
+    await second.close()
+    restarted = DiskCache(config=config)
+    assert await restarted.get("c") == make_response(b"c")
+    await restarted.close()
+
+
+async def test_disk_cache_drops_oldest_segments(tmp_path):
+    cache = DiskCache(
+        config=DiskConfig(path=str(tmp_path), max_size=300, segment_size=100)
+    )
+
+    for key in "abcdef":
+        await cache.set(key, make_response(key.encode() * 80))
+
+    assert not await cache.has("a")
+    assert await cache.get("f") == make_response(b"f" * 80)
+    assert len(list(tmp_path.glob("*.seg"))) <= 3
+    await cache.close()
+
+
+async def test_disk_cache_tags(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "_DISK_COMPACT_MIN", 10)
+    config = DiskConfig(path=str(tmp_path))
+    first = DiskCache(config=config)
+    second = DiskCache(config=config)
+
+    for i in range(50):
+        await first.set(str(i), make_response(b"x"))
+        await first.add_tags(str(i), ["users"])
+    # a record is appended per tagged key, the tag isn't rewritten
+    record_size = backends._DISK_TAG_RECORD.size
+    assert (tmp_path / "tags").stat().st_size <= (
+        backends._DISK_HEADER.size + 50 * (record_size + 2)
+    )
+
+    # the live keys of the tags are kept when the index is compacted
+    await first.delete("0")
+    for i in range(100):
+        await first.set("untagged", make_response(b"%d" % i))
+
+    keys = await second.invalidate_tag("users")
+    assert sorted(keys, key=int) == [str(i) for i in range(1, 50)]
+    assert not await first.has("1")
+    assert await first.invalidate_tag("users") == []
+
+    await first.close()
+    await second.close()
+
+
+async def test_disk_cache_compacts_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, "_DISK_COMPACT_MIN", 10)
+    cache = DiskCache(config=DiskConfig(path=str(tmp_path / "cache")))
+    assert (tmp_path / "cache").stat().st_mode & 0o777 == 0o700
+
+    for i in range(100):
+        await cache.set("a", make_response(b"%d" % i))
+    # the overwritten records are dropped from the index
+    index_size = (tmp_path / "cache" / "index").stat().st_size
+    assert index_size < 20 * backends._DISK_RECORD.size
+    assert await cache.get("a") == make_response(b"99")
+    await cache.close()
+
+
+@pytest.fixture
+def shared_memory_config():
+    config = SharedMemoryConfig(
+        name=f"aiohttp-cache-{uuid.uuid4().hex}", slots=8, slot_size=1024
+    )
+    yield config
+    SharedMemoryCache(config=config).unlink()
+
+
+async def test_shared_memory_cache_shared_across_instances(
+    shared_memory_config,
+):
+    first = SharedMemoryCache(config=shared_memory_config)
+    second = SharedMemoryCache(config=shared_memory_config)
+
+    await first.set("a", make_response(b"a" * 100))
+    assert await second.get("a") == make_response(b"a" * 100)
+
+    await second.delete("a")
+    assert not await first.has("a")
+
+    await first.set("b", make_response(b"b"))
+    await second.clear()
+    assert await first.get("b") is None
+
+    # bigger than a slot, it is never stored
+    await first.set("c", make_response(b"c" * 1024))
+    assert not await second.has("c")
+
+    await first.close()
+    await second.close()
+
+
+async def test_shared_memory_cache_private_lock_file(shared_memory_config):
+    cache = SharedMemoryCache(config=shared_memory_config)
+
+    directory = backends._lock_directory()
+    lock_path = os.path.join(directory, f"{shared_memory_config.name}.lock")
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert os.stat(lock_path).st_mode & 0o777 == 0o600
+    await cache.close()
+    os.unlink(lock_path)
+
+
+async def test_shared_memory_cache_lock_doesnt_block_loop(
+    shared_memory_config,
+):
+    cache = SharedMemoryCache(config=shared_memory_config)
+    await cache.set("a", make_response(b"a"))
+
+    lock_path = os.path.join(
+        backends._lock_directory(), f"{shared_memory_config.name}.lock"
+    )
+    holder = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        "import fcntl, os, sys, time\n"
+        f"fd = os.open({lock_path!r}, os.O_RDWR)\n"
+        "fcntl.lockf(fd, fcntl.LOCK_EX)\n"
+        "print('locked', flush=True)\n"
+        "time.sleep(0.2)\n",
+        stdout=asyncio.subprocess.PIPE,
+    )
+    assert await holder.stdout.readline() == b"locked\n"
+
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.ensure_future(tick())
+    # waits for the other process, without blocking the loop
+    await cache.clear()
+    assert ticks > 5
+    assert await cache.get("a") is None
+
+    ticker.cancel()
+    await holder.wait()
+    await cache.close()
+
+
+async def test_shared_memory_cache_replaces_oldest_slot(
+    shared_memory_config,
+):
+    cache = SharedMemoryCache(config=shared_memory_config)
+
+    for i in range(50):
+        await cache.set(str(i), make_response(b"x"))
+
+    assert await cache.has("49")
+    assert sum([await cache.has(str(i)) for i in range(50)]) == 8
+    await cache.close()
+
+
+async def test_make_key_reads_body_only_if_needed():
+    payload = StreamReader(
+        mock.Mock(), 2**16, loop=asyncio.get_running_loop()
+    )
+    payload.feed_data(b'{"hello": "aiohttp_cache"}')
+    payload.feed_eof()
+    request = make_mocked_request(
+        "POST",
+        "/path?a=1",
+        headers={"Host": "example.com", "Content-Type": "application/json"},
+        payload=payload,
+    )
+
+    cache = MemoryCache(
+        key_pattern=(AvailableKeys.method, AvailableKeys.path),
+        encrypt_key=False,
+    )
+    assert await cache.make_key(request) == "POST#/path?a=1"
+    assert not payload.at_eof()
+
+    cache.key_pattern = DEFAULT_KEY_PATTERN
+    assert await cache.make_key(request) == (
+        'POST#example.com#/path?a=1#{"hello": "aiohttp_cache"}'
+        "#application/json"
+    )
+
+    cache.encrypt_key = True
+    assert (
+        await cache.make_key(request)
+        == sha256(
+            b'POST#example.com#/path?a=1#{"hello": "aiohttp_cache"}'
+            b"#application/json"
+        ).hexdigest()
+    )
+
+
+async def test_make_key_with_key_hasher():
+    request = make_mocked_request("GET", "/path", headers={"Host": "a.com"})
+
+    cache = MemoryCache(key_hasher="blake2b")
+    key = await cache.make_key(request)
+    assert len(key) == 22
+    assert key == await cache.make_key(request)
+
+    with pytest.raises(HTTPCache):
+        MemoryCache(key_hasher="md4")
+
+
+async def test_key_builder_normalizes_query():
+    def make_request(path: str, language: str = "en") -> web.Request:
+        return make_mocked_request(
+            "GET",
+            path,
+            headers={"Host": "a.com", "Accept-Language": language},
+        )
+
+    builder = KeyBuilder(
+        sort_query=True,
+        query_deny=["utm_*"],
+        key_headers=["Accept-Language"],
+        encrypt_key=False,
+    )
+    key = await builder(make_request("/p?b=2&a=1&utm_source=x"))
+    assert key == "GET#a.com#/p?a=1&b=2##application/octet-stream#en"
+    assert key == await builder(make_request("/p?a=1&b=2"))
+    assert key != await builder(make_request("/p?a=1&b=2", language="fr"))
+
+    builder = KeyBuilder(query_allow=["page"], encrypt_key=False)
+    key = await builder(make_request("/p?page=2&session=1"))
+    assert key.startswith("GET#a.com#/p?page=2#")
+    builder = KeyBuilder(query_allow=[], encrypt_key=False)
+    key = await builder(make_request("/p?page=2"))
+    assert key.startswith("GET#a.com#/p#")
+
+
+async def test_circuit_breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+
+    async def fail():
+        raise ConnectionError()
+
+    async def succeed():
+        return "ok"
+
+    for _ in range(2):
+        with pytest.raises(BackendUnavailable):
+            await breaker.call(fail())
+    assert breaker.is_open
+
+    # open, the backend is not called
+    with pytest.raises(BackendUnavailable):
+        await breaker.call(succeed())
+
+    # probing after the recovery timeout closes it
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 20)
+    assert await breaker.call(succeed()) == "ok"
+    assert not breaker.is_open
+
+
+async def test_circuit_breaker_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, timeout=0.01)
+
+    with pytest.raises(BackendUnavailable):
+        await breaker.call(asyncio.sleep(1))
+    assert breaker.is_open
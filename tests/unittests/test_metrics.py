@@ -0,0 +1,60 @@
+from aiohttp_cache.metrics import (
+    BYPASS,
+    HIT,
+    MISS,
+    STALE,
+    CacheMetrics,
+    Histogram,
+)
+
+
+def test_histogram_cumulative_counts():
+    histogram = Histogram([0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [
+        ("0.1", 2),
+        ("1.0", 3),
+        ("+Inf", 4),
+    ]
+    assert histogram.count == 4
+    assert histogram.sum == 3.65
+
+
+def test_cache_metrics_hit_ratio():
+    metrics = CacheMetrics()
+    metrics.count("GET /a", HIT)
+    metrics.count("GET /a", STALE)
+    metrics.count("GET /a", MISS)
+    metrics.count("GET /b", MISS)
+    metrics.count("GET /b", BYPASS)
+
+    assert metrics.hit_ratio("GET /a") == 2 / 3
+    assert metrics.hit_ratio("GET /b") == 0
+    assert metrics.hit_ratio() == 2 / 5
+    assert CacheMetrics().hit_ratio() == 0
+
+
+def test_cache_metrics_render():
+    metrics = CacheMetrics(buckets=[0.1])
+    metrics.count('GET /"a"', HIT)
+    metrics.count('GET /"a"', MISS)
+    metrics.observe_handler('GET /"a"', 0.5)
+    metrics.observe_set(0.01, 100)
+    metrics.evicted(2)
+
+    text = metrics.render()
+    assert (
+        'aiohttp_cache_requests_total{route="GET /\\"a\\"",result="hit"} 1'
+    ) in text
+    assert (
+        f'aiohttp_cache_requests_total{{route="GET /\\"a\\"",result="{MISS}"}}'
+        " 1"
+    ) in text
+    assert (
+        'aiohttp_cache_handler_seconds_bucket{route="GET /\\"a\\"",le="0.1"} 0'
+    ) in text
+    assert ('aiohttp_cache_backend_seconds_count{operation="set"} 1') in text
+    assert "aiohttp_cache_stored_bytes_total 100\n" in text
+    assert "aiohttp_cache_evictions_total 2\n" in text
@@ -0,0 +1,61 @@
+import pytest
+
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from aiohttp_cache.serializers import (
+    BinarySerializer,
+    MsgpackSerializer,
+    PickleSerializer,
+    body_offset,
+)
+
+
+RESPONSE = {
+    "status": 200,
+    "headers": {"Content-Type": "application/json; charset=utf-8"},
+    "body": b'{"hello": "aiohttp_cache"}',
+}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        RESPONSE,
+        dict(RESPONSE, expires_at=12.5),
+        {"status": 204, "headers": {}, "body": None},
+        {"vary": ["Accept-Encoding"]},
+        42,
+    ],
+)
+def test_binary_serializer(value):
+    serializer = BinarySerializer()
+    assert serializer.loads(serializer.dumps(value)) == value
+
+
+def test_binary_serializer_body_is_not_copied():
+    data = BinarySerializer().dumps(RESPONSE)
+    loaded = BinarySerializer().loads(data)
+
+    assert isinstance(loaded["body"], memoryview)
+    assert data[body_offset(data) :] == RESPONSE["body"]
+    assert BinarySerializer().loads(b"!garbage") is None
+
+
+def test_binary_serializer_loads_multidict_headers():
+    headers = CIMultiDict([("Set-Cookie", "a=1"), ("Set-Cookie", "b=2")])
+    value = dict(RESPONSE, headers=CIMultiDictProxy(headers))
+
+    loaded = BinarySerializer().loads(BinarySerializer().dumps(value))
+    assert isinstance(loaded["headers"], CIMultiDict)
+    assert loaded["headers"].getall("set-cookie") == ["a=1", "b=2"]
+
+
+@pytest.mark.parametrize(
+    "serializer_class", [PickleSerializer, MsgpackSerializer]
+)
+def test_other_serializers(serializer_class):
+    if serializer_class is MsgpackSerializer:
+        pytest.importorskip("msgpack")
+
+    serializer = serializer_class()
+    assert serializer.loads(serializer.dumps(RESPONSE)) == RESPONSE